@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+
+# Indexes with fewer rows than this are always searched exhaustively, even when IVF lists were asked for:
+# a full scan of them is already fast and gives exact results
+ANN_MIN_ROWS = 50000
+DEFAULT_N_PROBE = 32
+IVF_FILES = ("ivf_centroids.npy", "ivf_offsets.npy", "ivf_rows.npy")
+
+def default_lists(count):
+    # About 2 * sqrt(n) lists keeps the coarse scan and the lists it probes both short
+    return max(1, int(2 * np.sqrt(count)))
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def assign(vectors, centroids, batch_size=65536):
+    """Index of the most similar centroid for every row of vectors, computed batch_size rows at a time."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+def train_centroids(vectors, n_lists, iterations=10, sample_size=100000, seed=0):
+    """Spherical k-means on a random sample of the (L2-normalised) vectors."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), max(sample_size, n_lists))
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = assign(sample, centroids)
+        counts = np.bincount(assignment, minlength=n_lists)
+        nonempty = np.flatnonzero(counts)
+        # Per-list sums with one sort and one reduceat instead of a Python loop over lists
+        order = np.argsort(assignment, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        centroids[nonempty] = _normalize(np.add.reduceat(sample[order], starts, axis=0))
+        # Lists that lost every vector restart from random sample points
+        empty = np.flatnonzero(counts == 0)
+        centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+    return centroids
+
+class IVFIndex:
+    """
+    Inverted-file coarse quantizer over an index's embedding matrix.
+
+    Every row belongs to the list of its nearest centroid. The lists are
+    stored in CSR form: rows[offsets[i]:offsets[i + 1]] are the (ascending)
+    row numbers in list i. A query is compared with the centroids and only
+    the rows of the n_probe closest lists are scored exactly, so search
+    cost grows with roughly sqrt(n) instead of n.
+    """
+    def __init__(self, centroids, offsets, rows):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, iterations=10, seed=0):
+        n_lists = min(n_lists or default_lists(len(vectors)), len(vectors))
+        centroids = train_centroids(vectors, n_lists, iterations=iterations, seed=seed)
+        assignment = assign(vectors, centroids)
+        rows = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids, offsets, rows)
+
+    @classmethod
+    def load(cls, index_dir):
+        centroids, offsets, rows = (np.load(os.path.join(index_dir, name), mmap_mode="r") for name in IVF_FILES)
+        return cls(np.asarray(centroids), np.asarray(offsets), rows)
+
+    @staticmethod
+    def exists(index_dir):
+        return all(os.path.exists(os.path.join(index_dir, name)) for name in IVF_FILES)
+
+    def save(self, index_dir):
+        for name, array in zip(IVF_FILES, (self.centroids, self.offsets, self.rows)):
+            np.save(os.path.join(index_dir, name), array)
+
+    def __len__(self):
+        return len(self.centroids)
+
+    def candidates(self, query, n_probe=DEFAULT_N_PROBE):
+        """Ascending row numbers in the n_probe lists whose centroids are closest to query."""
+        n_probe = min(n_probe, len(self.centroids))
+        scores = self.centroids @ query
+        lists = np.argpartition(-scores, n_probe - 1)[:n_probe]
+        rows = np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+        return np.sort(rows)
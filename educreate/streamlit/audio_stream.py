@@ -0,0 +1,169 @@
+import subprocess
+import tempfile
+
+import numpy as np
+
+from collections import namedtuple
+from io import BytesIO
+
+from pydub import AudioSegment
+
+# Whisper resamples to 16 kHz mono internally, so anything richer is wasted upload
+SPEECH_SAMPLE_RATE = 16000
+SPEECH_BITRATE = "32k"
+
+# One encoded slice of a recording, ready to upload
+Segment = namedtuple("Segment", ["index", "start_ms", "end_ms", "audio"])
+
+def probe_duration(path):
+    """Duration of a media file in seconds, read from the container without decoding, or None if it does not say."""
+    output = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                             "-of", "default=noprint_wrappers=1:nokey=1", path],
+                            capture_output=True, text=True, check=True).stdout
+    # Live streams and some containers report "N/A"
+    try:
+        return float(output.strip())
+    except ValueError:
+        return None
+
+def pcm_stream(path, sample_rate, channels, read_bytes):
+    """
+    Decode any ffmpeg-readable file to signed 16-bit PCM, yielding blocks of read_bytes.
+
+    The source is decoded exactly once, front to back, and only one block is
+    held in memory at a time. Raises RuntimeError, with ffmpeg's messages, if
+    ffmpeg fails or decodes no audio at all.
+    """
+    # stderr goes to a file rather than a pipe, so a chatty failure can never block ffmpeg's stdout
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(["ffmpeg", "-v", "error", "-i", path,
+                                    "-f", "s16le", "-ac", str(channels), "-ar", str(sample_rate), "-"],
+                                   stdout=subprocess.PIPE, stderr=errors)
+        decoded = 0
+        try:
+            while True:
+                block = process.stdout.read(read_bytes)
+                if not block:
+                    break
+                decoded += len(block)
+                yield block
+            process.wait()
+        finally:
+            process.stdout.close()
+            # Only still running if the consumer stopped early
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        if process.returncode != 0 or not decoded:
+            errors.seek(0)
+            message = errors.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"ffmpeg could not decode {path} (exit status {process.returncode}): {message or 'no audio decoded'}")
+
+def encode_segment(pcm, sample_rate, channels, index, bitrate):
+    segment = AudioSegment(data=pcm, sample_width=2, frame_rate=sample_rate, channels=channels)
+    buffer = BytesIO()
+    segment.export(buffer, format="mp3", bitrate=bitrate)
+    buffer.seek(0)
+    # The transcription API infers the format from the file name
+    buffer.name = f"segment_{index:03d}.mp3"
+    return buffer
+
+def stream_segments(path, segment_ms, sample_rate=44100, channels=2, bitrate="192k"):
+    """
+    Split a recording into fixed-length MP3 segments held in memory.
+
+    Yields Segment tuples in order. Peak memory is one segment of PCM plus its
+    encoding, independent of the length of the recording.
+    """
+    bytes_per_ms = sample_rate * channels * 2 / 1000
+    frame_bytes = channels * 2
+    segment_bytes = int(segment_ms * bytes_per_ms) // frame_bytes * frame_bytes
+
+    pending = b""
+    index = 0
+    start_ms = 0
+    for block in pcm_stream(path, sample_rate, channels, segment_bytes):
+        pending += block
+        while len(pending) >= segment_bytes:
+            pcm, pending = pending[:segment_bytes], pending[segment_bytes:]
+            end_ms = start_ms + round(len(pcm) / bytes_per_ms)
+            yield Segment(index, start_ms, end_ms, encode_segment(pcm, sample_rate, channels, index, bitrate))
+            index += 1
+            start_ms = end_ms
+
+    if pending:
+        end_ms = start_ms + round(len(pending) / bytes_per_ms)
+        yield Segment(index, start_ms, end_ms, encode_segment(pending, sample_rate, channels, index, bitrate))
+
+def frame_dbfs(samples, frame_samples):
+    frames = samples[:len(samples) // frame_samples * frame_samples].reshape(-1, frame_samples).astype(np.float32)
+    rms = np.sqrt(np.mean(frames**2, axis=1)) / 32768
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+def stream_speech_segments(path, target_ms, window_ms=60000, frame_ms=50, silence_dbfs=-40, keep_silence_ms=500, sample_rate=SPEECH_SAMPLE_RATE, bitrate=SPEECH_BITRATE):
+    """
+    Split a recording into speech-optimised MP3 segments cut at pauses.
+
+    The audio is decoded once to 16 kHz mono and analysed in frame_ms frames.
+    Silent stretches (below silence_dbfs) are shortened to keep_silence_ms, and
+    each segment ends at a quiet frame within window_ms of target_ms, so cuts
+    land between words rather than through them. Of the silent frames in the
+    window (or the quietest, if none is silent) the one closest to target_ms
+    is chosen, so segments stay close to target_ms long. start_ms and end_ms of
+    each Segment refer to the original recording.
+    """
+    frame_samples = sample_rate * frame_ms // 1000
+    target_frames = target_ms // frame_ms
+    window_frames = window_ms // frame_ms
+    keep_frames = keep_silence_ms // frame_ms
+    block_frames = 1200
+
+    samples = np.zeros(0, dtype=np.int16)   # kept audio not yet emitted
+    levels = np.zeros(0, dtype=np.float32)  # dBFS of each kept frame
+    positions = np.zeros(0, dtype=np.int64) # original frame index of each kept frame
+    leftover = np.zeros(0, dtype=np.int16)
+    silent_run = 0
+    frame_offset = 0
+    index = 0
+
+    def emit(cut):
+        nonlocal samples, levels, positions, index
+        pcm = samples[:cut * frame_samples].tobytes()
+        segment = Segment(index, int(positions[0]) * frame_ms, (int(positions[cut - 1]) + 1) * frame_ms,
+                          encode_segment(pcm, sample_rate, 1, index, bitrate))
+        samples, levels, positions = samples[cut * frame_samples:], levels[cut:], positions[cut:]
+        index += 1
+        return segment
+
+    for block in pcm_stream(path, sample_rate, 1, block_frames * frame_samples * 2):
+        block = np.concatenate([leftover, np.frombuffer(block, dtype=np.int16)])
+        whole = len(block) // frame_samples
+        block, leftover = block[:whole * frame_samples], block[whole * frame_samples:]
+        if whole == 0:
+            continue
+
+        # Length of the silent run each frame belongs to, carried across blocks
+        block_levels = frame_dbfs(block, frame_samples)
+        silent = block_levels < silence_dbfs
+        frame_ids = np.arange(whole)
+        last_voiced = np.maximum.accumulate(np.where(~silent, frame_ids, -1))
+        run = np.where(last_voiced < 0, frame_ids + 1 + silent_run, frame_ids - last_voiced)
+        silent_run = int(run[-1]) if silent[-1] else 0
+        keep = ~silent | (run <= keep_frames)
+
+        samples = np.concatenate([samples, block.reshape(whole, frame_samples)[keep].ravel()])
+        levels = np.concatenate([levels, block_levels[keep]])
+        positions = np.concatenate([positions, frame_offset + frame_ids[keep]])
+        frame_offset += whole
+
+        while len(levels) >= target_frames + window_frames:
+            lo = max(1, target_frames - window_frames)
+            window = levels[lo:target_frames + window_frames]
+            # In a pause most frames tie for quietest, and argmin alone would cut at the start of the window
+            quiet = np.flatnonzero(window <= max(float(window.min()), silence_dbfs))
+            cut = lo + int(quiet[np.argmin(np.abs(quiet + lo - target_frames))])
+            yield emit(cut)
+
+    if len(levels):
+        yield emit(len(levels))
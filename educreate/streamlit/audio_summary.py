@@ -1,23 +1,70 @@
+import hashlib
+import math
 import os
-import tiktoken
-import yt_dlp
+import re
+import shutil
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
 
 import streamlit as st
 
+from concurrent.futures import ThreadPoolExecutor
+from disk_cache import DiskCache
+from audio_stream import SPEECH_BITRATE, SPEECH_SAMPLE_RATE, probe_duration, stream_segments, stream_speech_segments
 from keys import openai_token
-from openai import OpenAI
-from pydub import AudioSegment
+from llm_clients import llm_clients
+from registry import registry
+from tokenizer import count_tokens, split_by_tokens
+from transcription import transcribe_segments
 
-client = OpenAI(api_key = openai_token)
+# Requests go through the shared client pool; OPENAI_BASE_URL can point them at a local stub server
 openai_model = "gpt-4o-mini"
-
-def count_tokens(text, model=openai_model):
-  # Load the appropriate tokenizer for the model
-  encoding = tiktoken.encoding_for_model(model)
-  # Encode the text to get the tokens
-  tokens = encoding.encode(text)
-  # Return the number of tokens
-  return len(tokens)
+transcription_model = "whisper-1"
+
+youtube_id_pattern = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})")
+
+def summarize_chunk(text, max_words):
+  return llm_clients().complete("OpenAI", openai_token, openai_model,
+      system=f"""Summarize this part of a lesson transcript in LESS THAN {max_words} words. Keep every key point, name, date and example in the order they were taught.""",
+      messages=[
+          {"role": "user", "content": [{"type": "text", "text": f"Here is the text: {text}"}]}
+          ],
+      temperature=0)
+
+def condense_transcript(text, max_tokens=128000, chunk_tokens=16000, max_words=25000, max_workers=8, max_passes=3):
+  """
+  Map-reduce summarisation for transcripts too long for one call.
+
+  The transcript is cut into chunk_tokens pieces that are summarised
+  concurrently, each into its share of the max_words budget. The summaries
+  are joined in order, and the process repeats only if the result is still
+  over max_tokens, so latency stays close to one summarisation call however
+  long the recording is.
+
+  At most max_passes passes are made, and a pass that does not shrink the
+  text ends them early; whatever is still over max_tokens is then
+  truncated, so a model that ignores the word budget cannot keep the loop
+  (and its bill) going.
+  """
+  tokens = count_tokens(text, openai_model)
+  for _ in range(max_passes):
+    if tokens < max_tokens:
+      return text
+    chunks = split_by_tokens(text, chunk_tokens, openai_model)
+    words_per_chunk = max(300, max_words // len(chunks))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      summaries = list(executor.map(lambda chunk: summarize_chunk(chunk, words_per_chunk), chunks))
+    text = "\n\n".join(summaries)
+    previous, tokens = tokens, count_tokens(text, openai_model)
+    if tokens >= previous:
+      break
+
+  if tokens >= max_tokens:
+    print(f"Transcript still {tokens} tokens after summarising; truncating to {max_tokens - 1}")
+    text = split_by_tokens(text, max_tokens - 1, openai_model)[0]
+  return text
 
 # Function to extract audio from any YouTube video
 def extract_audio_from_yt(youtube_path, output_path):
@@ -34,67 +81,149 @@ def extract_audio_from_yt(youtube_path, output_path):
   print(output_path)
   if os.path.exists(output_path + '.mp3'):
     os.remove(output_path + '.mp3') 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    with registry.module("yt_dlp").YoutubeDL(ydl_opts) as ydl:
         ydl.download([youtube_path])
         metadata = ydl.extract_info(youtube_path, download= False)
         length = metadata['duration']
   else:
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    with registry.module("yt_dlp").YoutubeDL(ydl_opts) as ydl:
             ydl.download([youtube_path])
             metadata = ydl.extract_info(youtube_path, download= False)
             length = metadata['duration']
   return length    
 
-# Function to extract audio from any video
-def extract_audio_from_video(video_path, audio_output_path):
-  print(video_path)
-  video = AudioSegment.from_file(video_path, format="mp4")
-  length = len(video)
-  video.export(audio_output_path, format="mp3")
-  return length
+# Function to identify a lesson video: the YouTube video ID, or a hash of the file contents
+def video_key(type, url):
+  if type == "YouTube":
+    match = youtube_id_pattern.search(url)
+    if match:
+      video_id = match.group(1)
+    else:
+      with registry.module("yt_dlp").YoutubeDL({'quiet': True}) as ydl:
+        video_id = ydl.extract_info(url, download=False)['id']
+    return f"youtube:{video_id}:{transcription_model}"
+
+  # Other videos are keyed on their contents, so a re-uploaded file hits and a changed one at the same URL misses
+  digest = hashlib.sha256()
+  with open(url, 'rb') as video_file:
+    for block in iter(lambda: video_file.read(1024 * 1024), b''):
+      digest.update(block)
+  return f"file:{digest.hexdigest()}:{transcription_model}"
+
+# Function to identify a remote video without downloading it: its URL plus the HTTP validators the server
+# sends for it, or None if the server sends neither an ETag nor a Last-Modified date
+def url_key(url, timeout=30):
+  try:
+    with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=timeout) as response:
+      headers = response.headers
+  except urllib.error.URLError:
+    # Some servers refuse HEAD; the video is then keyed on its contents once downloaded
+    return None
+  validators = [headers.get(name, "") for name in ("ETag", "Last-Modified", "Content-Length")]
+  if not any(validators[:2]):
+    return None
+  digest = hashlib.sha256("\n".join([url] + validators).encode("utf-8")).hexdigest()
+  return f"url:{digest}:{transcription_model}"
+
+# Function to download a video to a temporary file, so it can be hashed and then decoded from disk
+def download_video(url, timeout=60):
+  suffix = os.path.splitext(urllib.parse.urlparse(url).path)[1]
+  with urllib.request.urlopen(url, timeout=timeout) as response, tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as video_file:
+    shutil.copyfileobj(response, video_file, 1024 * 1024)
+  return video_file.name
+
+@st.cache_resource
+def get_transcript_cache(max_bytes=512 * 1024**2):
+  return DiskCache("./cache/transcripts.sqlite", max_bytes)
+
+# Function to transcribe a single in-memory audio file
+def transcribe_audio(audio_file):
+  return llm_clients().transcribe(openai_token, transcription_model, audio_file)
 
-def extract(type, url, user_prompt):
+def transcribe_video(type, url, on_progress=None, max_workers=4, segmentation="silence", stats=None):
     if type == "YouTube":
         audio_output_path = '/content/yt_audio'
         length = extract_audio_from_yt(url, audio_output_path)
         print("length: ", length)
         load_audio_path = audio_output_path + '.mp3'
     else:
-        audio_output_path = '/content/vid_audio.mp3'
-        length = extract_audio_from_video(url, audio_output_path)
-        load_audio_path = audio_output_path
+        # ffmpeg reads the audio track straight out of the video, no intermediate mp3 needed
+        duration = probe_duration(url)
+        length = math.ceil(duration) if duration is not None else None
+        load_audio_path = url
 
     increment = 8 #increment value in minutes
-    a = list(range(0, length*1000, increment*1000*60))
-    b = list(range(increment*1000*60, length*1000 + increment*1000*60, increment*1000*60))
-    splits = list(zip(a,b))
-
-    full_trans = ''
-    for i in splits:
-        print("i is:", i)
-        full_file = AudioSegment.from_mp3(load_audio_path)
-        file_seg = full_file[i[0]:i[1]]
-        file_seg.export("intermediate.mp3", format="mp3")
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=open('intermediate.mp3', 'rb')
-        )
-        print(transcription.text)
-        full_trans += ' ' + transcription.text
-
-    num_tokens = count_tokens(full_trans)
-
-    if num_tokens < 128000:
-        pass
+
+    # Without a known duration, progress counts up to the segments submitted so far
+    num_segments = max(1, math.ceil(length / (increment*60))) if length is not None else 1
+
+    def report(done, submitted):
+        if on_progress is not None:
+            on_progress(done, max(num_segments, submitted))
+
+    # Decode the audio once to low-bitrate mono, cut at pauses (or every 8 minutes) and
+    # transcribe the segments concurrently, straight from memory
+    if segmentation == "silence":
+        segments = stream_speech_segments(load_audio_path, target_ms=increment*1000*60)
     else:
-        summ_transcription = client.chat.completions.create(
-            model=openai_model,
-            messages=[
-                {"role": "system", "content": """Summarize the text to be LESS THAN 25000 words."""},
-                {"role": "user", "content": [{"type": "text", "text": f"Here is the text: {full_trans}"}]}
-                ],
-            temperature=0)
-        full_trans = summ_transcription
+        segments = stream_segments(load_audio_path, segment_ms=increment*1000*60, sample_rate=SPEECH_SAMPLE_RATE, channels=1, bitrate=SPEECH_BITRATE)
+
+    stats = {} if stats is None else stats
+    stats.update({"segments": 0, "bytes_uploaded": 0, "audio_seconds": length})
+
+    def counted(segments):
+        for segment in segments:
+            stats["segments"] += 1
+            stats["bytes_uploaded"] += segment.audio.getbuffer().nbytes
+            yield segment
+
+    # Rate limits and server errors are already retried by the client pool; retry anything else once
+    texts = transcribe_segments(counted(segments), transcribe_audio, max_workers=max_workers, retries=1, on_progress=report)
+    # Trimmed pauses can leave fewer segments than the estimate; finish the progress bar on the real count
+    if on_progress is not None:
+        on_progress(stats["segments"], stats["segments"])
+    print(f"Uploaded {stats['bytes_uploaded'] / 1024**2:.1f} MB in {stats['segments']} segments")
+    return ' '.join(texts)
+
+def extract(type, url, user_prompt, on_progress=None, max_workers=4, segmentation="silence", stats=None, stream=False):
+    """
+    Lesson plan for a video: transcribe (or reuse the stored transcript), condense, then answer user_prompt.
+
+    With stream=True the transcript is still prepared up front, and the
+    lesson plan is returned as a generator of text pieces as the model
+    writes them (e.g. for st.write_stream).
+    """
+    stats = {} if stats is None else stats
+
+    # Only the final chat call depends on the prompt; reuse the transcript of a video seen before.
+    # A video that is not a local file is looked up by its URL and HTTP validators first, so a cached one
+    # is never downloaded; on a miss it is fetched once, then hashed and decoded from disk
+    transcript_cache = get_transcript_cache()
+    remote = type != "YouTube" and not os.path.isfile(url)
+    keys = [key for key in [url_key(url) if remote else video_key(type, url)] if key is not None]
+    cached = transcript_cache.get(keys[0]) if keys else None
+    download_path = None
+    try:
+        if cached is None and remote:
+            download_path = download_video(url)
+            keys.append(video_key(type, download_path))
+            cached = transcript_cache.get(keys[-1])
+        stats["cached"] = cached is not None
+        if cached is not None:
+            full_trans = cached.decode('utf-8')
+        else:
+            full_trans = transcribe_video(type, download_path or url, on_progress=on_progress, max_workers=max_workers, segmentation=segmentation, stats=stats)
+            # An empty transcript means nothing usable was heard; don't serve that for this video from now on
+            if not full_trans.strip():
+                raise RuntimeError(f"No speech could be transcribed from {url}")
+        # A hit is always on the last key looked up; store the transcript under the keys that missed
+        for key in (keys if cached is None else keys[:-1]):
+            transcript_cache.set(key, full_trans.encode('utf-8'))
+    finally:
+        if download_path is not None:
+            os.remove(download_path)
+
+    full_trans = condense_transcript(full_trans, max_workers=max_workers)
 
     system_context = """
     You are a high school History teacher and an expert in a broad range of History topics.
@@ -103,16 +232,14 @@ def extract(type, url, user_prompt):
     Please ONLY provide your responses to the questions or instructions. DO NOT add responses such as 'Of Course, Certainly etc.'
     Here are the instructions from your teaching colleague:""" + user_prompt
 
-    response = client.chat.completions.create(
-        model=openai_model,
+    respond = llm_clients().stream if stream else llm_clients().complete
+    return respond("OpenAI", openai_token, openai_model,
+        system=system_context,
         messages=[
-        {"role": "system", "content": system_context},
-        {"role": "user", "content": [{"type": "text", "text": f"Here is the audio transcription of the lesson: {transcription.text}"}]}
+        {"role": "user", "content": [{"type": "text", "text": f"Here is the audio transcription of the lesson: {full_trans}"}]}
         ],
         temperature=0)
 
-    return response.choices[0].message.content
-
 @st.cache_resource
 def setup_pipeline(user_session_id):
     st.session_state['transcription'] = ""
\ No newline at end of file
@@ -0,0 +1,80 @@
+# Benchmark audio segmentation for the lesson planner on a synthetic recording.
+# Each strategy runs in its own subprocess so peak memory is measured separately.
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+def write_synthetic_audio(path, minutes, sample_rate=44100):
+    # Speech-like bursts of tone and noise separated by short pauses, written a minute at a time
+    rng = np.random.default_rng(0)
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        t = np.arange(sample_rate * 60) / sample_rate
+        for minute in range(minutes):
+            envelope = (np.sin(2 * np.pi * 0.3 * t + minute) > -0.6).astype(np.float32)
+            signal = envelope * (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(t.size))
+            pcm = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+            wav_file.writeframes(np.repeat(pcm[:, None], 2, axis=1).tobytes())
+
+def run_legacy(path, segment_ms):
+    # The original extract() loop: re-decode the whole file for every segment
+    from pydub import AudioSegment
+    length_ms = len(AudioSegment.from_file(path))
+    uploaded = 0
+    for start in range(0, length_ms, segment_ms):
+        full_file = AudioSegment.from_file(path)
+        full_file[start:start + segment_ms].export("intermediate.mp3", format="mp3")
+        uploaded += os.path.getsize("intermediate.mp3")
+    os.remove("intermediate.mp3")
+    return uploaded
+
+def run_stream(path, segment_ms):
+    from audio_stream import stream_segments
+    return sum(segment.audio.getbuffer().nbytes for segment in stream_segments(path, segment_ms))
+
+def run_speech(path, segment_ms):
+    from audio_stream import stream_speech_segments
+    return sum(segment.audio.getbuffer().nbytes for segment in stream_speech_segments(path, segment_ms))
+
+def child(strategy, path, segment_ms):
+    start = time.perf_counter()
+    uploaded = {"legacy": run_legacy, "stream": run_stream, "speech": run_speech}[strategy](path, segment_ms)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+    print(f"{strategy:>8} {seconds:>9.1f} {peak_mb:>12.0f} {uploaded / 1024**2:>12.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lesson audio segmentation on synthetic audio.")
+    parser.add_argument("--minutes", type=int, default=90)
+    parser.add_argument("--segment-minutes", type=int, default=8)
+    parser.add_argument("--strategies", nargs="+", default=["legacy", "stream", "speech"])
+    parser.add_argument("--child", nargs=3, metavar=("STRATEGY", "PATH", "SEGMENT_MS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], int(args.child[2]))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "lesson.wav")
+        write_synthetic_audio(path, args.minutes)
+        print(f"{args.minutes} minute synthetic recording, {args.segment_minutes} minute segments")
+        print(f"{'strategy':>8} {'seconds':>9} {'peak RSS MB':>12} {'uploaded MB':>12}")
+        for strategy in args.strategies:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child", strategy, path,
+                            str(args.segment_minutes * 60 * 1000)], check=True, cwd=tmp_dir,
+                           env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Benchmark history retrieval strategies on a fixture query set: dense only (the previous retriever),
+# BM25 only, BM25 fused with dense (hybrid), and dense scoring narrowed to the BM25 matches.
+# The index is built from the comic example summaries unless --index-dir points at a built one.
+# A query is a hit when a retrieved chunk contains its judged answer, a phrase from the source summary that
+# never appears in the query itself, so BM25 can't score hits just by echoing it. Latency excludes embedding the query.
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from langchain_core.documents import Document
+
+from ann_index import DEFAULT_N_PROBE
+from bench_ingest import HashEmbeddings, load_fixtures
+from ingest import build
+from vector_index import VectorIndex
+
+queries_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "comic_examples", "retrieval_queries.json")
+
+def candidates(index, strategy, query, query_embedding, fetch_k, n_probe, lexical_k):
+    if strategy == "dense":
+        return index.search(query_embedding, fetch_k, n_probe=n_probe)
+    if strategy == "bm25":
+        return index.lexical.search(query, fetch_k)[0], None
+    return index.hybrid_search(query, query_embedding, fetch_k, n_probe=n_probe, lexical_k=lexical_k, narrow=strategy == "narrow")
+
+def retrieve(index, strategy, query, query_embedding, fetch_k, k, n_probe, lexical_k):
+    """The fetch_k candidates and the k chunks MMR picks from them, as IndexRetriever does."""
+    rows, query_vector = candidates(index, strategy, query, query_embedding, fetch_k, n_probe, lexical_k)
+    if query_vector is None:
+        return rows, rows[:k]
+    return rows, index.select_mmr(rows, query_vector, k)
+
+def build_fixture_index(index_dir, embedder, model_name, copies):
+    sources, texts = load_fixtures(copies)
+
+    def fetch(source):
+        path = source[1].rsplit("#", 1)[0]
+        return [Document(page_content=texts[path], metadata={"source": source[1]})]
+
+    return build(index_dir, sources, embedder, model_name, fetch=fetch)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dense, lexical and hybrid retrieval on fixture queries.")
+    parser.add_argument("--index-dir", default=None, help="Existing index to measure (default: one built from the comic examples)")
+    parser.add_argument("--queries", default=queries_path, help="JSON list of {\"query\": ..., \"source\": ..., \"answer\": ...}")
+    parser.add_argument("--copies", type=int, default=1, help="Times to repeat the fixture documents in the built index")
+    parser.add_argument("--embedder", choices=["hash", "hf"], default="hf",
+                        help="hash vectors carry no meaning, so only their latency is comparable")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--lexical-k", type=int, default=100)
+    parser.add_argument("--n-probe", type=int, default=DEFAULT_N_PROBE)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the query set")
+    args = parser.parse_args()
+
+    with open(args.queries) as queries_file:
+        fixtures = json.load(queries_file)
+    echoed = [fixture["query"] for fixture in fixtures if fixture["answer"].lower() in fixture["query"].lower()]
+    if echoed:
+        raise SystemExit(f"{len(echoed)} queries contain their own answer, e.g. {echoed[0]!r}; judge them by a phrase the query doesn't use")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        index_dir = args.index_dir
+        if args.embedder == "hf":
+            from langchain_huggingface import HuggingFaceEmbeddings
+            from rag_poc import embedding_model_name
+            model_name = VectorIndex(index_dir).model_name if index_dir else embedding_model_name
+            embedder = HuggingFaceEmbeddings(model_name=model_name)
+        else:
+            model_name = "hash"
+            embedder = HashEmbeddings(call_overhead=0)
+        if index_dir is None:
+            index_dir = os.path.join(work_dir, "index")
+            build_fixture_index(index_dir, embedder, model_name, args.copies)
+
+        index = VectorIndex(index_dir)
+        if index.lexical is None:
+            raise SystemExit(f"{index_dir} has no lexical index; rebuild it with 'python rag_poc.py'")
+        query_embeddings = embedder.embed_documents([fixture["query"] for fixture in fixtures])
+
+        print(f"{len(index)} chunks, {len(fixtures)} queries, {args.embedder} embedder, k {args.k}, fetch_k {args.fetch_k}, lexical_k {args.lexical_k}")
+        print(f"{'strategy':>9} {'p50 ms':>8} {'p99 ms':>8} {'hit@fetch_k':>12} {'hit@k':>7}")
+        for strategy in ["dense", "bm25", "hybrid", "narrow"]:
+            latencies, candidate_hits, hits = [], [], []
+            for _ in range(args.repeat):
+                for fixture, query_embedding in zip(fixtures, query_embeddings):
+                    start = time.perf_counter()
+                    rows, selected = retrieve(index, strategy, fixture["query"], query_embedding, args.fetch_k, args.k, args.n_probe, args.lexical_k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    answer = fixture["answer"].lower()
+                    candidate_hits.append(any(answer in index.texts[row].lower() for row in rows))
+                    hits.append(any(answer in index.texts[row].lower() for row in selected))
+            print(f"{strategy:>9} {np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f} "
+                  f"{np.mean(candidate_hits):>12.1%} {np.mean(hits):>7.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Offline benchmark for the ingestion pipeline in ingest.py.
+# The comic example summaries stand in for fetched pages, with an artificial
+# per-fetch latency to mimic Wikipedia/web round trips.
+import argparse
+import glob
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from langchain_core.documents import Document
+
+from ingest import ingest
+
+fixture_glob = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "comic_examples", "*", "Summary document.txt")
+
+class HashEmbeddings:
+    """Deterministic stand-in for HuggingFaceEmbeddings with a fixed per-call overhead."""
+    def __init__(self, dim=768, call_overhead=0.05):
+        self.dim = dim
+        self.call_overhead = call_overhead
+
+    def embed_documents(self, texts):
+        time.sleep(self.call_overhead)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vectors.append(np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def load_fixtures(copies):
+    paths = sorted(glob.glob(fixture_glob))
+    if not paths:
+        raise FileNotFoundError(f"No fixture documents found at {fixture_glob}")
+    texts = {}
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as fixture_file:
+            texts[path] = fixture_file.read()
+    sources = [("Fixture", f"{path}#{copy}") for copy in range(copies) for path in paths]
+    return sources, texts
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark corpus ingestion on local fixture documents.")
+    parser.add_argument("--copies", type=int, default=4, help="Times to repeat the fixture set")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per fetch")
+    parser.add_argument("--embedder", choices=["hash", "hf"], default="hash")
+    parser.add_argument("--call-overhead", type=float, default=0.05, help="Simulated seconds per embedding call (hash embedder)")
+    args = parser.parse_args()
+
+    sources, texts = load_fixtures(args.copies)
+
+    def fetch(source):
+        time.sleep(args.latency)
+        path = source[1].rsplit("#", 1)[0]
+        return [Document(page_content=texts[path], metadata={"source": source[1]})]
+
+    if args.embedder == "hf":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from rag_poc import embedding_model_name
+        embedder = HuggingFaceEmbeddings(model_name=embedding_model_name)
+    else:
+        embedder = HashEmbeddings(call_overhead=args.call_overhead)
+
+    print(f"{len(sources)} sources, fetch latency {args.latency}s, {args.embedder} embedder")
+    print(f"{'workers':>8} {'batch':>6} {'chunks':>7} {'seconds':>8} {'chunks/s':>9}")
+    for max_workers, batch_size in [(1, 16), (8, 256), (16, 256)]:
+        _, _, _, stats = ingest(sources, embedder, fetch=fetch, max_workers=max_workers, batch_size=batch_size)
+        print(f"{max_workers:>8} {batch_size:>6} {stats['chunks']:>7} {stats['seconds']:>8.2f} {stats['chunks_per_s']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
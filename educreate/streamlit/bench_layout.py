@@ -0,0 +1,87 @@
+# Benchmark comic strip composition: the previous create_comic_strip against comic_layout.ComicCanvas.
+# Each run happens in its own subprocess so peak memory is measured separately.
+import argparse
+import math
+import os
+import resource
+import subprocess
+import sys
+import textwrap
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+font_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ComicNeue-BoldItalic.ttf")
+
+caption = ("President John F Kennedy receives a report from his adviser that missile sites have been found in Cuba. "
+           "The year was 1962 and the world was at its closest to a nuclear war.")
+
+def legacy_create_comic_strip(images, texts, image_width, image_height, panels_horizontal, panels_vertical, border_size=10, text_height=150, font_path=None, font_size=40, max_caption=45):
+    # create_comic_strip as it was before the layout engine
+    max_caption_word = max(len(text.split()) for text in texts)
+    mult_standard_text_box = math.ceil(2 * max_caption_word / max_caption) / 2
+    text_height = math.ceil(mult_standard_text_box * text_height)
+    total_width = (image_width + 2 * border_size) * panels_horizontal
+    total_height = (image_height + 2 * border_size + text_height) * panels_vertical
+    new_image = Image.new('RGB', (total_width, total_height), 'white')
+    font = ImageFont.truetype(font_path, size=font_size) if font_path else ImageFont.load_default()
+    for i, (image, text) in enumerate(zip(images, texts)):
+        image = image.resize((image_width, image_height))
+        panel = Image.new('RGB', (image_width + 2 * border_size, image_height + 2 * border_size + text_height), 'white')
+        panel.paste(image, (border_size, border_size))
+        draw = ImageDraw.Draw(panel)
+        text_position = (border_size, image_height + 2 * border_size)
+        draw.rectangle([text_position, (panel.width - border_size, panel.height - border_size)], fill="white")
+        wrapped_text = textwrap.fill(text, width=(image_width // font_size * 2))
+        draw.text((text_position[0] + 10, text_position[1] + 10), wrapped_text, font=font, fill="black")
+        x_offset = (i % panels_horizontal) * (image_width + 2 * border_size)
+        y_offset = (i // panels_horizontal) * (image_height + 2 * border_size + text_height)
+        new_image.paste(panel, (x_offset, y_offset))
+    return new_image
+
+def child(strategy, panels, size, repeats):
+    from comic_layout import ComicCanvas, grid_rows
+
+    images = [Image.new('RGB', (size, size), (40 * i % 256, 90, 160)) for i in range(panels)]
+    texts = [f"{i + 1}. {caption}" for i in range(panels)]
+    rows = grid_rows(panels, math.ceil(panels / 2) if panels <= 6 else 4)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if strategy == "legacy":
+            if len(set(rows)) > 1:
+                print(f"{strategy:>8} {panels:>7} {'n/a (grid only)':>24}")
+                return
+            legacy_create_comic_strip(images, texts, size, size, rows[0], len(rows), font_path=font_path, font_size=30)
+        else:
+            canvas = ComicCanvas(texts, size, size, rows=rows, font_path=font_path, font_size=30)
+            for i, image in enumerate(images):
+                canvas.add_panel(i, image)
+    milliseconds = (time.perf_counter() - start) / repeats * 1000
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024
+    print(f"{strategy:>8} {panels:>7} {milliseconds:>11.1f} {peak_mb:>12.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark comic strip composition time and memory.")
+    parser.add_argument("--panels", type=int, nargs="+", default=[4, 6, 8, 12])
+    parser.add_argument("--size", type=int, default=1024, help="Panel width and height in pixels")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", nargs=2, metavar=("STRATEGY", "PANELS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), args.size, args.repeats)
+        return
+
+    print(f"{args.size}px panels, mean of {args.repeats} runs")
+    print(f"{'strategy':>8} {'panels':>7} {'compose ms':>11} {'peak +MB':>12}")
+    for panels in args.panels:
+        for strategy in ["legacy", "canvas"]:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child", strategy, str(panels),
+                            "--size", str(args.size), "--repeats", str(args.repeats)], check=True,
+                           env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Report recall against memory for the float32, float16 and int8 embedding copies on held-out queries.
+# Each dtype is searched in its own process so the resident set it reports is only what that dtype touched.
+# Every query goes through the app retriever's path, search for fetch_k candidates and then MMR down to
+# --mmr-k, so the timings and memory include reading the candidates' full-precision vectors.
+# Queries are perturbed copies of random rows (or --queries-file); the reference is an exact float32 search.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_retrieval import synthetic_index
+from quantization import EMBEDDING_DTYPES, QuantizedMatrix, save_quantized
+from vector_index import VectorIndex, normalize_rows
+
+def resident_mb():
+    """Anonymous and file-backed resident memory of this process, in MB."""
+    fields = {}
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            name, _, value = line.partition(":")
+            fields[name] = value.split()[0] if value.split() else "0"
+    return {"anon": int(fields.get("RssAnon", 0)) / 1024, "file": int(fields.get("RssFile", 0)) / 1024}
+
+def run_dtype(args):
+    """Search every query with one dtype and print the results as JSON (runs in a child process)."""
+    index = VectorIndex(args.index_dir)
+    index.quantized = QuantizedMatrix.load(args.work_dir, args.child) if args.child != "float32" else None
+    queries = np.load(os.path.join(args.work_dir, "queries.npy"))
+    truth = np.load(os.path.join(args.work_dir, "truth.npy"))
+    before = resident_mb()
+
+    results = []
+    for rescore in ([0] if index.quantized is None else [0] + args.rescore):
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            rows, query_vector = index.search(query, args.k, n_probe=args.n_probe, rescore=rescore)
+            index.select_mmr(rows, query_vector, args.mmr_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(set(rows.tolist()) & set(expected.tolist())) / len(expected))
+        results.append({"rescore": rescore, "recall": float(np.mean(recalls)), "p50_ms": float(np.percentile(latencies, 50))})
+
+    after = resident_mb()
+    scanned = index.quantized.nbytes if index.quantized is not None else index.embeddings.nbytes
+    print(json.dumps({"dtype": args.child, "scanned_mb": scanned / 1024**2, "results": results,
+                      "rss_file_mb": after["file"], "rss_anon_mb": after["anon"],
+                      "rss_growth_mb": after["file"] + after["anon"] - before["file"] - before["anon"]}))
+
+def prepare(args, index_dir):
+    """Write the held-out queries, their exact float32 neighbours and every quantized copy to args.work_dir."""
+    index = VectorIndex(index_dir)
+    rng = np.random.default_rng(1)
+    if args.queries_file:
+        queries = normalize_rows(np.load(args.queries_file))
+    else:
+        sample = np.asarray(index.embeddings[np.sort(rng.choice(len(index), args.queries, replace=False))])
+        queries = normalize_rows(sample + rng.standard_normal(sample.shape, dtype=np.float32) * (0.5 / np.sqrt(sample.shape[1])))
+    index.quantized = None
+    truth = np.stack([index.search(query, args.k, n_probe=0)[0] for query in queries])
+    np.save(os.path.join(args.work_dir, "queries.npy"), queries)
+    np.save(os.path.join(args.work_dir, "truth.npy"), truth)
+    for dtype in EMBEDDING_DTYPES[1:]:
+        save_quantized(args.work_dir, index.embeddings, dtype)
+    return len(index), len(queries)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall and memory of quantized embedding copies.")
+    parser.add_argument("--index-dir", default=None, help="Existing index to measure (default: a synthetic one)")
+    parser.add_argument("--queries-file", default=None, help=".npy of held-out query embeddings (default: perturbed rows)")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=768, help="Embedding size (GIST-Embedding-v0 is 768)")
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20, help="Neighbours compared with the exact search (the retriever's fetch_k)")
+    parser.add_argument("--mmr-k", type=int, default=8, help="Chunks MMR picks from the k candidates (the retriever's k)")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[2, 4, 8], help="Shortlist sizes, as multiples of k, rescored at full precision")
+    parser.add_argument("--n-probe", type=int, default=0, help="IVF lists to probe (0 scans every row)")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Allowed recall loss with the default rescore factor")
+    parser.add_argument("--work-dir", default=None, help="Where to write the temporary index and copies")
+    parser.add_argument("--child", choices=EMBEDDING_DTYPES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_dtype(args)
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        index_dir = args.index_dir
+        if index_dir is None:
+            index_dir = os.path.join(work_dir, "index")
+            os.makedirs(index_dir)
+            synthetic_index(index_dir, args.rows, args.dim, args.clusters, ann_lists=None)
+        args.work_dir = work_dir
+        rows, queries = prepare(args, index_dir)
+
+        print(f"{rows} rows, {queries} held-out queries, recall@{args.k} against exact float32, n_probe {args.n_probe}")
+        print(f"{'dtype':>8} {'scanned MB':>11} {'RSS MB':>8} {'rescore':>8} {'recall':>7} {'p50 ms':>8}")
+        failed = False
+        for dtype in EMBEDDING_DTYPES:
+            command = [sys.executable, os.path.abspath(__file__), "--child", dtype, "--index-dir", index_dir, "--work-dir", work_dir,
+                       "--k", str(args.k), "--mmr-k", str(args.mmr_k), "--n-probe", str(args.n_probe), "--rescore", *map(str, args.rescore)]
+            report = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+            rss = report["rss_file_mb"] + report["rss_anon_mb"]
+            for result in report["results"]:
+                rescore = f"{result['rescore']}x" if result["rescore"] else "-"
+                print(f"{dtype:>8} {report['scanned_mb']:>11.1f} {rss:>8.1f} {rescore:>8} {result['recall']:>7.3f} {result['p50_ms']:>8.2f}")
+            # The default search path (rescore=4) must stay within tolerance of the exact result
+            default = next((r for r in report["results"] if r["rescore"] == 4), report["results"][0])
+            if default["recall"] < 1 - args.tolerance:
+                print(f"{dtype:>8} FAIL: recall {default['recall']:.3f} with rescore {default['rescore']}x is below {1 - args.tolerance:.3f}")
+                failed = True
+        sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
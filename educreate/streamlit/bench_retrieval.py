@@ -0,0 +1,135 @@
+# Benchmark history retrieval latency on synthetic indexes: exact search with LangChain's MMR (the previous
+# retriever), exact search with the vectorised MMR, and IVF search with the vectorised MMR.
+# Synthetic vectors are drawn around --clusters centres (0 for no clusters, IVF's worst case); queries are
+# perturbed copies of random rows. Well-separated clusters flatter IVF, so before building IVF lists for
+# the history index, measure its recall with --index-dir and real query embeddings (--queries-file).
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import DEFAULT_N_PROBE, IVFIndex
+from vector_index import INDEX_FORMAT_VERSION, READY_FILE, VectorIndex, mmr, normalize_rows
+
+def cosine_similarity(x, y):
+    x = np.asarray(x)
+    y = np.asarray(y)
+    return (x @ y.T) / np.outer(np.linalg.norm(x, axis=1), np.linalg.norm(y, axis=1))
+
+def legacy_mmr(query_embedding, embedding_list, lambda_mult=0.5, k=4):
+    # langchain_community.vectorstores.utils.maximal_marginal_relevance
+    if min(k, len(embedding_list)) <= 0:
+        return []
+    similarity_to_query = cosine_similarity(query_embedding[None, :], embedding_list)[0]
+    idxs = [int(np.argmax(similarity_to_query))]
+    selected = np.array([embedding_list[idxs[0]]])
+    while len(idxs) < min(k, len(embedding_list)):
+        best_score = -np.inf
+        idx_to_add = -1
+        similarity_to_selected = cosine_similarity(embedding_list, selected)
+        for i, query_score in enumerate(similarity_to_query):
+            if i in idxs:
+                continue
+            redundant_score = max(similarity_to_selected[i])
+            equation_score = lambda_mult * query_score - (1 - lambda_mult) * redundant_score
+            if equation_score > best_score:
+                best_score = equation_score
+                idx_to_add = i
+        idxs.append(idx_to_add)
+        selected = np.append(selected, [embedding_list[idx_to_add]], axis=0)
+    return idxs
+
+def synthetic_index(index_dir, rows, dim, clusters, ann_lists, seed=0, batch_size=50000):
+    """Write a ready index of rows clustered unit vectors, with IVF lists, without holding it all in memory."""
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.standard_normal((clusters, dim), dtype=np.float32))
+    vectors = np.lib.format.open_memmap(os.path.join(index_dir, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(rows, dim))
+    for start in range(0, rows, batch_size):
+        count = min(batch_size, rows - start)
+        if clusters:
+            noise = rng.standard_normal((count, dim), dtype=np.float32) * (0.8 / np.sqrt(dim))
+            vectors[start:start + count] = normalize_rows(centers[rng.integers(clusters, size=count)] + noise)
+        else:
+            vectors[start:start + count] = normalize_rows(rng.standard_normal((count, dim), dtype=np.float32))
+    vectors.flush()
+
+    with open(os.path.join(index_dir, "chunks.jsonl"), "w") as chunk_file:
+        chunk_file.writelines(f'{{"text": "chunk {row}", "metadata": {{}}}}\n' for row in range(rows))
+    with open(os.path.join(index_dir, "meta.json"), "w") as meta_file:
+        json.dump({"format_version": INDEX_FORMAT_VERSION, "model_name": "synthetic", "count": rows, "dim": dim}, meta_file)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(vectors, n_lists=ann_lists)
+    ivf.save(index_dir)
+    build_seconds = time.perf_counter() - start
+
+    with open(os.path.join(index_dir, READY_FILE), "w") as ready_file:
+        ready_file.write(str(INDEX_FORMAT_VERSION))
+    return len(ivf), build_seconds
+
+def retrieve(index, query, fetch_k, k, n_probe, select):
+    candidates, query_vector = index.search(query, fetch_k, n_probe=n_probe)
+    candidates = np.sort(candidates)
+    candidate_vectors = index.vectors(candidates)
+    return [candidates[i] for i in select(query_vector, candidate_vectors, k=k)], candidates
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency at increasing corpus sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=768, help="Embedding size (GIST-Embedding-v0 is 768)")
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--n-probe", type=int, default=DEFAULT_N_PROBE)
+    parser.add_argument("--ann-lists", type=int, default=None, help="IVF lists (default: about 2*sqrt(rows))")
+    parser.add_argument("--work-dir", default=None, help="Where to write the temporary indexes")
+    parser.add_argument("--index-dir", default=None, help="Measure a built index instead (IVF lists are built in memory)")
+    parser.add_argument("--queries-file", default=None, help=".npy of real query embeddings for --index-dir (default: perturbed rows)")
+    args = parser.parse_args()
+
+    strategies = [("exact + legacy mmr", 0, legacy_mmr), ("exact + numpy mmr", 0, mmr), ("ivf + numpy mmr", args.n_probe, mmr)]
+    if args.index_dir:
+        index = VectorIndex(args.index_dir)
+        start = time.perf_counter()
+        index.ivf = IVFIndex.build(index.embeddings, n_lists=args.ann_lists)
+        build_seconds = time.perf_counter() - start
+        queries = normalize_rows(np.load(args.queries_file)) if args.queries_file else None
+        print(f"{args.index_dir}: dim {index.embeddings.shape[1]}, k {args.k}, fetch_k {args.fetch_k}, n_probe {args.n_probe}")
+        report(index, queries, args, strategies, len(index.ivf), build_seconds)
+        return
+
+    print(f"dim {args.dim}, k {args.k}, fetch_k {args.fetch_k}, n_probe {args.n_probe}, {args.queries} queries")
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory(dir=args.work_dir) as index_dir:
+            lists, build_seconds = synthetic_index(index_dir, rows, args.dim, args.clusters, args.ann_lists)
+            index = VectorIndex(index_dir)
+            report(index, None, args, strategies, lists, build_seconds)
+            del index
+
+def report(index, queries, args, strategies, lists, build_seconds):
+    rows = len(index)
+    if queries is None:
+        rng = np.random.default_rng(1)
+        sample = np.asarray(index.embeddings[np.sort(rng.choice(rows, args.queries, replace=False))])
+        queries = normalize_rows(sample + rng.standard_normal(sample.shape, dtype=np.float32) * (0.5 / np.sqrt(sample.shape[1])))
+
+    print(f"{'rows':>9} {'strategy':>18} {'p50 ms':>9} {'p99 ms':>9} {'recall@fetch_k':>15}")
+    exact = {}
+    for name, n_probe, select in strategies:
+        latencies, recalls = [], []
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            _, candidates = retrieve(index, query, args.fetch_k, args.k, n_probe, select)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if n_probe == 0:
+                exact[i] = set(candidates.tolist())
+            recalls.append(len(exact[i] & set(candidates.tolist())) / len(exact[i]))
+        print(f"{rows:>9} {name:>18} {np.percentile(latencies, 50):>9.2f} {np.percentile(latencies, 99):>9.2f} {np.mean(recalls):>15.3f}")
+    print(f"{rows:>9} {'':>18} IVF: {lists} lists built in {build_seconds:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Benchmark cold start of each Streamlit page: the time and memory to run a page script's imports and
+# top level in a fresh interpreter, as a new server process or page switch does. "eager" imports the
+# SDKs and model libraries the pages used to import up front, for comparison.
+import argparse
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+pages = {
+    "welcome": "Welcome to EduCreate.py",
+    "comic": "pages/1_Comic_Generator.py",
+    "lesson": "pages/2_Lesson_Planner.py",
+    "audio": "pages/2_Audio_Summarization.py",
+}
+
+heavy_modules = ["torch", "diffusers", "transformers", "langchain_core", "langchain_community", "langchain_huggingface",
+                 "langchain_anthropic", "langchain_openai", "anthropic", "openai", "easyocr", "pymupdf", "tiktoken", "yt_dlp"]
+
+def child(page):
+    os.chdir(here)
+    sys.path.insert(0, here)
+    start = time.perf_counter()
+    if page == "eager":
+        for name in heavy_modules:
+            try:
+                __import__(name)
+            except ImportError:
+                pass
+    else:
+        # Any run_name other than "__main__" runs the page's top level without calling main()
+        runpy.run_path(os.path.join(here, pages[page]), run_name="bench_startup")
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    loaded = [name for name in heavy_modules if name in sys.modules]
+    print(f"{page:>8} {seconds:>10.2f} {peak_mb:>10.0f} {len(sys.modules):>8}  {', '.join(loaded) or '-'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold-start time of each page.")
+    parser.add_argument("--pages", nargs="+", default=list(pages) + ["eager"], choices=list(pages) + ["eager"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    print(f"Fresh interpreter per run, {args.repeats} runs per page")
+    print(f"{'page':>8} {'seconds':>10} {'peak MB':>10} {'modules':>8}  heavy modules imported")
+    for page in args.pages:
+        for _ in range(args.repeats):
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child", page])
+
+if __name__ == "__main__":
+    main()
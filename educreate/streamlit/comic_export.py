@@ -0,0 +1,55 @@
+from io import BytesIO
+
+# Download formats offered for the finished comic: (file extension, mime type, Pillow save options)
+EXPORT_FORMATS = {
+    "WebP": ("webp", "image/webp", {"format": "webp", "method": 4}),
+    "JPEG": ("jpg", "image/jpeg", {"format": "jpeg", "optimize": True}),
+    "Progressive JPEG": ("jpg", "image/jpeg", {"format": "jpeg", "optimize": True, "progressive": True}),
+    "PNG": ("png", "image/png", {"format": "png", "optimize": True}),
+}
+
+def encode_image(image, export_format, quality=None):
+    options = dict(EXPORT_FORMATS[export_format][2])
+    if quality is not None and options["format"] != "png":
+        options["quality"] = quality
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+def encode_to_budget(image, export_format, max_bytes, min_quality=40, max_quality=92):
+    """
+    Encode image in export_format at the best quality that fits in max_bytes.
+
+    Lossy formats binary-search the quality setting. If even min_quality (or
+    lossless PNG) is too large, the image is downscaled by the square root of
+    the overshoot and tried again. Returns the encoded bytes.
+    """
+    lossless = EXPORT_FORMATS[export_format][2]["format"] == "png"
+    while True:
+        if lossless:
+            data = encode_image(image, export_format)
+        else:
+            data = None
+            low, high = min_quality, max_quality
+            while low <= high:
+                quality = (low + high) // 2
+                candidate = encode_image(image, export_format, quality)
+                if len(candidate) <= max_bytes:
+                    data, low = candidate, quality + 1
+                else:
+                    high = quality - 1
+            if data is None:
+                data = candidate
+
+        if len(data) <= max_bytes or min(image.size) <= 256:
+            return data
+        scale = max(0.5, (max_bytes / len(data)) ** 0.5 * 0.95)
+        image = image.resize((int(image.width * scale), int(image.height * scale)))
+
+def make_preview(image, max_width=1600, quality=80):
+    """Small JPEG of the strip for display on the page."""
+    preview = image.copy()
+    preview.thumbnail((max_width, max_width * image.height // image.width + 1))
+    buffer = BytesIO()
+    preview.convert("RGB").save(buffer, format="jpeg", quality=quality)
+    return buffer.getvalue()
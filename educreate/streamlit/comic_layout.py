@@ -0,0 +1,119 @@
+import functools
+import math
+
+from PIL import Image, ImageDraw, ImageFont
+
+@functools.lru_cache(maxsize=16)
+def load_font(font_path=None, font_size=40):
+    # Fonts are immutable once loaded, so one instance per (path, size) is shared by every strip
+    return ImageFont.truetype(font_path, size=font_size) if font_path else ImageFont.load_default()
+
+def wrap_text(text, font, max_width):
+    """Greedy word wrap using the font's real glyph advances."""
+    lines = []
+    line = ""
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if line and font.getlength(candidate) > max_width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines
+
+def grid_rows(num_panels, panels_per_row):
+    """Split num_panels into rows of panels_per_row, the last row holding the remainder."""
+    full, remainder = divmod(num_panels, panels_per_row)
+    return [panels_per_row] * full + ([remainder] if remainder else [])
+
+class ComicLayout:
+    """
+    Geometry of a comic strip, computed once.
+
+    rows gives the number of panels in each row (e.g. [3, 3] for the classic
+    2x3 grid, or [4, 4, 4] for twelve panels); shorter rows are centred. The
+    caption box height is the tallest wrapped caption, measured with the
+    font's glyph metrics, and never less than text_height.
+    """
+    def __init__(self, texts, rows, image_width, image_height, border_size=10, text_height=150, font_path=None, font_size=40, padding=10, line_spacing=4):
+        if sum(rows) != len(texts):
+            raise ValueError(f"The number of texts ({len(texts)}) does not match the total number of panels ({sum(rows)})")
+
+        self.rows = rows
+        self.image_width = image_width
+        self.image_height = image_height
+        self.border_size = border_size
+        self.padding = padding
+        self.font = load_font(font_path, font_size)
+
+        left, top, right, bottom = self.font.getbbox("Ay")
+        self.line_height = bottom - top + line_spacing
+        self.lines = [wrap_text(text, self.font, image_width - 2 * padding) for text in texts]
+        max_lines = max((len(lines) for lines in self.lines), default=0)
+        self.text_height = max(text_height, max_lines * self.line_height + 2 * padding)
+
+        self.panel_width = image_width + 2 * border_size
+        self.panel_height = image_height + 2 * border_size + self.text_height
+        self.width = self.panel_width * max(rows)
+        self.height = self.panel_height * len(rows)
+
+        # Top-left corner of every panel, in reading order
+        self.origins = []
+        for row, count in enumerate(rows):
+            x_start = (self.width - count * self.panel_width) // 2
+            for column in range(count):
+                self.origins.append((x_start + column * self.panel_width, row * self.panel_height))
+
+    def __len__(self):
+        return len(self.origins)
+
+    def image_box(self, i):
+        x, y = self.origins[i]
+        return (x + self.border_size, y + self.border_size)
+
+    def text_origin(self, i):
+        x, y = self.origins[i]
+        return (x + self.border_size + self.padding, y + self.image_height + 2 * self.border_size + self.padding)
+
+class ComicCanvas:
+    """
+    Comic strip composed one panel at a time onto a single preallocated canvas.
+
+    Panels are pasted and captioned in place, in any order, as they finish;
+    once every panel is in, image is the finished strip. Pass either
+    panels_horizontal and panels_vertical for a grid, or rows for any other
+    arrangement (see ComicLayout).
+    """
+    def __init__(self, texts, image_width, image_height, panels_horizontal=None, panels_vertical=None, rows=None, border_size=10, text_height=150, font_path=None, font_size=40, thumbnail_width=256):
+        if rows is None:
+            rows = [panels_horizontal] * panels_vertical
+        self.layout = ComicLayout(texts, rows, image_width, image_height, border_size=border_size, text_height=text_height, font_path=font_path, font_size=font_size)
+        self.panels_horizontal = max(rows)
+        self.thumbnail_width = thumbnail_width
+        self.thumbnails = {}
+
+        self.image = Image.new('RGB', (self.layout.width, self.layout.height), 'white')
+        self._draw = ImageDraw.Draw(self.image)
+
+    @property
+    def complete(self):
+        return len(self.thumbnails) == len(self.layout)
+
+    def add_panel(self, i, image):
+        layout = self.layout
+        if image.size != (layout.image_width, layout.image_height):
+            image = image.resize((layout.image_width, layout.image_height))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        self.image.paste(image, layout.image_box(i))
+
+        x, y = layout.text_origin(i)
+        for line in layout.lines[i]:
+            self._draw.text((x, y), line, font=layout.font, fill="black")
+            y += layout.line_height
+
+        # Keep a small copy so the page can show panels as they arrive
+        scale = self.thumbnail_width / layout.image_width
+        self.thumbnails[i] = image.resize((self.thumbnail_width, max(1, math.ceil(layout.image_height * scale))), reducing_gap=2.0)
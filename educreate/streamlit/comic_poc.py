@@ -1,22 +1,23 @@
 import json
-import math
 import os
-import pickle
 
-import textwrap
 import streamlit as st
-import torch
-
-from anthropic import Anthropic
-from diffusers import StableDiffusion3Pipeline
-from langchain_anthropic import ChatAnthropic
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_openai import ChatOpenAI
-from openai import OpenAI
-from PIL import Image, ImageDraw, ImageFont
-from transformers import T5EncoderModel, BitsAndBytesConfig
+
+from image_backends import StubPipeline
+from disk_cache import DiskCache
+from image_generation import DEFAULT_PANEL_CACHE_PATH
+from image_worker import GenerationWorker
+from llm_clients import llm_clients
+from comic_layout import ComicCanvas
+from registry import registry
+from response_cache import ResponseCache
+from tokenizer import count_tokens
+from vector_index import DEFAULT_INDEX_DIR, VectorIndex, index_ready
+
+# torch, diffusers, transformers, LangChain and the vendor SDKs take seconds to import, so they are
+# imported through the registry on first use instead of whenever a page imports this module
+
+diffusion_model_id = "stabilityai/stable-diffusion-3-medium-diffusers"
 
 style_list = {"Japanese Anime": {
         "prompt": "coloured anime artwork created by a Japanese anime studio, (Anime Style:1.3), (Manga Style:1.3), highly emotional, vibrant colors, best quality, high resolution",
@@ -43,29 +44,27 @@ style_list = {"Japanese Anime": {
         "negative_prompt": "realistic, photo, highly detailed, photograph, 3D rendering, text, error, cropped, worst quality, low quality, normal quality, jpeg artifacts, signature, watermark, blurry, grayscale, noisy, grainy"}
     }
 
-@st.cache_resource
-def setup_pipeline(huggingface_token):
-    torch.cuda.set_device(1)
-    quantization_config = BitsAndBytesConfig(load_in_8bit=True)
-    model_id = "stabilityai/stable-diffusion-3-medium-diffusers"
+def load_diffusion_pipeline(huggingface_token):
+    # EDUCREATE_IMAGE_BACKEND=stub swaps in a CPU stand-in for the diffusion pipeline
+    if os.environ.get("EDUCREATE_IMAGE_BACKEND") == "stub":
+        return StubPipeline()
 
-    #Check to see if the RAG model has yet been run and pickled. 
-    if os.path.exists('./retriever.pkl'):
-        pass
-    else:
-        import rag_poc
+    torch = registry.module("torch")
+    transformers = registry.module("transformers")
+    diffusers = registry.module("diffusers")
 
-    with open("retriever.pkl",'rb') as input_file:
-        rag_retriever = pickle.load(input_file)
+    torch.cuda.set_device(int(os.environ.get("EDUCREATE_CUDA_DEVICE", "1")))
+    quantization_config = transformers.BitsAndBytesConfig(load_in_8bit=True)
+    model_id = diffusion_model_id
 
-    text_encoder = T5EncoderModel.from_pretrained(model_id,
+    text_encoder = transformers.T5EncoderModel.from_pretrained(model_id,
                                                 subfolder="text_encoder_3",
                                                 quantization_config=quantization_config,
                                                 cache_dir = './hub',
                                                 token = huggingface_token
                                                 )
 
-    pipe = StableDiffusion3Pipeline.from_pretrained(model_id,
+    pipe = diffusers.StableDiffusion3Pipeline.from_pretrained(model_id,
                                                     text_encoder_3=text_encoder,
                                                     device_map="balanced",
                                                     torch_dtype=torch.float16,
@@ -75,13 +74,64 @@ def setup_pipeline(huggingface_token):
 
     torch.cuda.empty_cache()
 
-    return pipe, rag_retriever
+    return pipe
+
+def load_history_retriever():
+    from index_retriever import IndexRetriever
+    HuggingFaceEmbeddings = registry.module("langchain_huggingface").HuggingFaceEmbeddings
+
+    history_index = VectorIndex(DEFAULT_INDEX_DIR)
+    query_embeddings = HuggingFaceEmbeddings(model_name=history_index.model_name)
+    # EDUCREATE_FETCH_K sets how many nearest chunks MMR chooses the 8 from
+    fetch_k = int(os.environ.get("EDUCREATE_FETCH_K", "20"))
+    # EDUCREATE_RETRIEVAL is "dense" (the default), "hybrid" (BM25 fused with dense) or "narrow" (dense
+    # scoring limited to the BM25 matches); keep dense until bench_hybrid.py shows the others help
+    retrieval = os.environ.get("EDUCREATE_RETRIEVAL", "dense")
+    return IndexRetriever(index=history_index, embeddings=query_embeddings, search_type="mmr", k=8, fetch_k=fetch_k,
+                          hybrid=retrieval != "dense", narrow=retrieval == "narrow")
+
+@st.cache_resource
+def setup_pipeline(huggingface_token, warm_up=True):
+    """
+    Register the comic page's heavy resources with the registry.
+
+    Nothing is loaded here: "history_retriever" and "generation_worker" are
+    built on the first registry.get(), or ahead of time on a background
+    thread when warm_up is set (EDUCREATE_WARM_UP=0 turns it off), so the
+    page renders while the embedding model and SDKs load.
+    """
+    #Check that the RAG index has been built. Building it is a separate step (python rag_poc.py).
+    if not index_ready(DEFAULT_INDEX_DIR):
+        st.error('The history index has not been built yet. Run "python rag_poc.py" and reload the page.', icon="🚨")
+        st.stop()
+
+    # One worker per server process owns the diffusion pipeline; every session queues jobs on it.
+    # The worker loads the pipeline on its own thread, so starting it only costs the thread.
+    def load_generation_worker():
+        model_id = "stub" if os.environ.get("EDUCREATE_IMAGE_BACKEND") == "stub" else diffusion_model_id
+        panel_cache = DiskCache(DEFAULT_PANEL_CACHE_PATH, max_bytes=2 * 1024**3)
+        # EDUCREATE_IMAGE_BATCH sets how many panels go through the pipeline per call; raise it on GPUs with the memory
+        batch_size = int(os.environ.get("EDUCREATE_IMAGE_BATCH", "2"))
+        return GenerationWorker(lambda: load_diffusion_pipeline(huggingface_token), cache=panel_cache, model_id=model_id, batch_size=batch_size)
+
+    registry.register("history_retriever", load_history_retriever)
+    registry.register("generation_worker", load_generation_worker)
+    if warm_up and os.environ.get("EDUCREATE_WARM_UP", "1") != "0":
+        registry.warm_up(["generation_worker", "llm_clients", "history_retriever"], modules=["langchain_core.runnables", "openai", "anthropic"])
+    return registry
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
 
 @st.cache_resource
 def initialize_session(user_session_id, anthropic_token, openai_token):
     st.session_state['comic_strip'] = ""
     st.session_state['captions'] = ""
     st.session_state['comic_output'] = ""
+    st.session_state['comic_preview'] = ""
+    st.session_state['comic_version'] = 0
+    st.session_state['comic_output_key'] = None
     st.session_state['text'] = ""
     st.session_state['summ_response'] = ""
     st.session_state['token_dict'] = dict(zip(["Anthropic","OpenAI"], [anthropic_token, openai_token]))
@@ -89,7 +139,19 @@ def initialize_session(user_session_id, anthropic_token, openai_token):
 def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
-def create_story_prompt(retriever, token, user_prompt, user_input, model_type):
+def create_story_prompt(retriever, token, user_prompt, upload_index, model_type, stream=False, upload_k=4, prompt_stats=None):
+    """
+    Answer the teacher's objective from the history index.
+
+    upload_index is the session's UploadIndex for an uploaded file, or None;
+    only its upload_k passages closest to the question are added to the
+    prompt. Returns the summary text, or with stream=True a generator of
+    text pieces as the model writes them (e.g. for st.write_stream).
+
+    prompt_stats, if given, receives the prompt size in tokens
+    ("prompt_tokens") and the upload's size, whole ("upload_total_tokens")
+    and as passed to the model ("upload_tokens", "upload_passages").
+    """
     summ_rag_template = """You are an expert in a broad range of History topics.
         History teachers will be asking questions or provide instructions about a specific topic to help prepare classroom materials.
         Provide detailed response for the question or instructions catering to high school students.
@@ -97,65 +159,68 @@ def create_story_prompt(retriever, token, user_prompt, user_input, model_type):
         Please respond to the question or instruction below based on the context information provided.
         JUST ANSWER the question or instruction. DO NOT ADD replies such as 'Of Course!', 'Certainly' etc.
         You may add factual information from your corpus of knowledge BUT ensure the additional information is factual.
-        \n\nHere are the topics and context:\n{context} """ + user_input + """\n\nHere is a question: \n{question}."""
+        \n\nHere are the topics and context:\n{context} {upload_context}\n\nHere is a question: \n{question}."""
     
+    ChatPromptTemplate = registry.module("langchain_core.prompts").ChatPromptTemplate
+    StrOutputParser = registry.module("langchain_core.output_parsers").StrOutputParser
+    RunnablePassthrough = registry.module("langchain_core.runnables").RunnablePassthrough
+    RunnableLambda = registry.module("langchain_core.runnables").RunnableLambda
+
     summ_rag_prompt = ChatPromptTemplate.from_template(summ_rag_template)
 
     output_parser = StrOutputParser()
 
+    clients = llm_clients()
+    improve_instruction = "Improve the question or instruction prompt provided for the Retrieval-Augmented Generation model. The improved prompt should NOT EXCEED 50 words."
+
     if model_type == 'Anthropic':
-        chat_model = ChatAnthropic(anthropic_api_key=token,
-                                model="claude-3-5-sonnet-20240620",
-                                temperature = 0.3)
-
-        rag_chain = (
-            {"context": retriever | format_docs,
-            "question": RunnablePassthrough()}
-            | summ_rag_prompt
-            | chat_model
-            | output_parser
-            )
-
-        client = Anthropic(api_key=token)
-
-        user_prompt_improved = client.messages.create(
-        max_tokens=2048,
-        model="claude-3-5-sonnet-20240620",
-        system = "Improve the question or instruction prompt provided for the Retrieval-Augmented Generation model. The improved prompt should NOT EXCEED 50 words.",
-        messages=[
-            {"role": "user", "content": user_prompt},
-            {"role":"assistant", "content":"A better version of the question is:"}
-        ]
-        )
-        output = user_prompt_improved.content[0].text    
+        chat_model = clients.chat_model("Anthropic", token, "claude-3-5-sonnet-20240620", temperature = 0.3)
 
-    elif model_type == 'OpenAI':
-        chat_model = ChatOpenAI(api_key=token,
-                               model="gpt-4o-mini",
-                               max_tokens=512,
-                               timeout=None,
-                               temperature=0.3,
-                               max_retries=2)
-
-        rag_chain = (
-            {"context": retriever | format_docs,
-            "question": RunnablePassthrough()}
-            | summ_rag_prompt
-            | chat_model
-            | output_parser
-            )
-
-        client = OpenAI(api_key = token)
-
-        user_prompt_improved = client.chat.completions.create(
-            model="gpt-4o-mini",
+        output = clients.complete("Anthropic", token, "claude-3-5-sonnet-20240620",
+            max_tokens=2048,
+            system = improve_instruction,
             messages=[
-            {"role": "system", "content": "Improve the question or instruction prompt provided for the Retrieval-Augmented Generation model. The improved prompt should NOT EXCEED 50 words. Just provide the answer."},
-            {"role": "user", "content": user_prompt}])
+                {"role": "user", "content": user_prompt},
+                {"role":"assistant", "content":"A better version of the question is:"}
+            ])
 
-        output = user_prompt_improved.choices[0].message.content
+    elif model_type == 'OpenAI':
+        chat_model = clients.chat_model("OpenAI", token, "gpt-4o-mini", max_tokens=512, temperature=0.3)
+
+        output = clients.complete("OpenAI", token, "gpt-4o-mini",
+            system = improve_instruction + " Just provide the answer.",
+            messages=[{"role": "user", "content": user_prompt}])
+
+    prompt_stats = {} if prompt_stats is None else prompt_stats
+
+    def upload_context(question):
+        if upload_index is None:
+            return ""
+        passages = upload_index.search(question, k=upload_k)
+        text = "\n\n".join(passages)
+        prompt_stats["upload_passages"] = len(passages)
+        prompt_stats["upload_total_tokens"] = upload_index.total_tokens
+        prompt_stats["upload_tokens"] = count_tokens(text)
+        return text
+
+    def measure_prompt(prompt_value):
+        prompt_stats["prompt_tokens"] = count_tokens(prompt_value.to_string())
+        return prompt_value
+
+    rag_chain = (
+        {"context": retriever | format_docs,
+        "upload_context": RunnableLambda(upload_context),
+        "question": RunnablePassthrough()}
+        | summ_rag_prompt
+        | RunnableLambda(measure_prompt)
+        | chat_model
+        | output_parser
+        )
+
+    if stream:
+        return clients.stream_call(model_type, rag_chain.stream, output)
 
-    summ_response = rag_chain.invoke(output)
+    summ_response = clients.call(model_type, rag_chain.invoke, output)
     return summ_response
 
 def create_image_prompts(token, summ_response, style_prompt, model_type):
@@ -203,32 +268,19 @@ def create_image_prompts(token, summ_response, style_prompt, model_type):
     "title": "JFK and the Cuban Missile Crisis"}
     """
 
+    messages = [
+        {"role": "user", "content": user_content},
+        {"role": "assistant", "content": assistant_content},
+        {"role": "user", "content": summ_response}
+    ]
+
     if model_type == 'Anthropic':
-        client = Anthropic(api_key=token)
-        image_response = client.messages.create(
-            max_tokens=2048,
-            model="claude-3-5-sonnet-20240620",
-            system = system_content,
-            messages=[
-                {"role": "user", "content": user_content},
-                {"role": "assistant", "content": assistant_content},
-                {"role": "user", "content": summ_response}
-            ]
-        )
-        rag_results_final = json.loads(image_response.content[0].text)
+        image_response = llm_clients().complete("Anthropic", token, "claude-3-5-sonnet-20240620", messages, system = system_content, max_tokens=2048)
 
     elif model_type == 'OpenAI':
-        client = OpenAI(api_key = token)
-        image_response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content},
-                {"role": "assistant", "content": assistant_content},
-                {"role": "user", "content": summ_response}
-            ]
-        )
-        rag_results_final = json.loads(image_response.choices[0].message.content)
+        image_response = llm_clients().complete("OpenAI", token, "gpt-4o-mini", messages, system = system_content)
+
+    rag_results_final = json.loads(image_response)
 
     character_prompt = rag_results_final["character"]
     context_prompt = rag_results_final["context"]
@@ -243,32 +295,7 @@ def create_image_prompts(token, summ_response, style_prompt, model_type):
 
     return captions, combined_prompt
 
-# Generate images
-def create_images(combined_prompt, pipe, negative_prompt):
-    seed = 1924
-    generator = torch.Generator("cuda").manual_seed(seed)
-    comic_images = []
-
-    progress_bar = st.progress(0, "Generating Images")
-    total_len = len(combined_prompt)
-    i = 0
-
-    for prompt in combined_prompt:
-        image = pipe(prompt=prompt,
-                    negative_prompt_3=negative_prompt,
-                    num_inference_steps=50,
-                    height=1024,
-                    width=1024,
-                    guidance_scale=7.0,
-                    generator=generator).images[0]
-        comic_images.append(image)
-        i+=1
-        progress_bar.progress(i/total_len, "Generating Images")
-        torch.cuda.empty_cache()
-
-    return comic_images
-
-def create_comic_strip(images, texts, image_width, image_height, panels_horizontal, panels_vertical, border_size=10, text_height=150, font_path=None, font_size=40, max_caption = 45):
+def create_comic_strip(images, texts, image_width, image_height, panels_horizontal, panels_vertical, border_size=10, text_height=150, font_path=None, font_size=40):
     """
     Organize images into a comic strip with borders and text boxes.
 
@@ -281,10 +308,9 @@ def create_comic_strip(images, texts, image_width, image_height, panels_horizont
     panels_horizontal: Number of panels placed horizontally
     panels_vertical: Number of panels placed vertically
     border_size: Size of the border around each panel
-    text_height: Height of the text box at the bottom of each panel
+    text_height: Minimum height of the text box at the bottom of each panel
     font_path: Path to the font file for the text
     font_size: Font size for the text
-    max_captions: Maximum number of words in a caption
     """
     # Ensure the number of images matches the number of panels
     num_panels = panels_horizontal * panels_vertical
@@ -295,52 +321,9 @@ def create_comic_strip(images, texts, image_width, image_height, panels_horizont
     if len(texts) != num_panels:
         raise ValueError(f"The number of texts ({len(texts)}) does not match the total number of panels ({num_panels})")
 
-    # Check highest number of words in the captions
-    caption_word_counts = []
-    for caption in texts:
-      caption_words = caption.split()
-      word_caption_count = len(caption_words)
-      caption_word_counts.append(word_caption_count)
-
-    max_caption_word = max(caption_word_counts)
-
-    # Determine text box size
-    mult_standard_text_box = math.ceil(2 * max_caption_word / max_caption) / 2
-    text_height = math.ceil(mult_standard_text_box * text_height)
-
-    # Calculate total dimensions of the comic strip
-    total_width = (image_width + 2 * border_size) * panels_horizontal
-    total_height = (image_height + 2 * border_size + text_height) * panels_vertical
-
-    # Create a new image with the total dimensions
-    new_image = Image.new('RGB', (total_width, total_height), 'white')
-
-    # Load the font
-    font = ImageFont.truetype(font_path, size=font_size) if font_path else ImageFont.load_default()
-
-    # Paste images into the new image
-    for i, (image, text) in enumerate(zip(images, texts)):
-        image = image.resize((image_width, image_height))
-
-        # Create a panel with a border
-        panel = Image.new('RGB', (image_width + 2 * border_size, image_height + 2 * border_size + text_height), 'white')
-        panel.paste(image, (border_size, border_size))
-
-        # Draw the text box
-        draw = ImageDraw.Draw(panel)
-        text_position = (border_size, image_height + 2 * border_size)
-        draw.rectangle([text_position, (panel.width - border_size, panel.height - border_size)], fill="white")
-
-        # Wrap the text to fit within the text box
-        wrapped_text = textwrap.fill(text, width=(image_width // font_size * 2))
-
-        # Add the text to the text box
-        draw.text((text_position[0] + 10, text_position[1] + 10), wrapped_text, font=font, fill="black")
-
-        # Calculate position in the new image
-        x_offset = (i % panels_horizontal) * (image_width + 2 * border_size)
-        y_offset = (i // panels_horizontal) * (image_height + 2 * border_size + text_height)
-        new_image.paste(panel, (x_offset, y_offset))
+    canvas = ComicCanvas(texts, image_width, image_height, panels_horizontal, panels_vertical, border_size=border_size, text_height=text_height, font_path=font_path, font_size=font_size)
+    for i, image in enumerate(images):
+        canvas.add_panel(i, image)
 
     # Save the new comic strip image
-    return new_image
\ No newline at end of file
+    return canvas.image
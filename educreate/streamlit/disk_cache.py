@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+import time
+
+class DiskCache:
+    """
+    Size-bounded key/value store of bytes in a single SQLite file.
+
+    Entries are evicted least-recently-used first once the stored values exceed
+    max_bytes. SQLite takes care of locking, so one file can be shared by the
+    index build, every Streamlit worker and notebook experiments.
+    """
+    def __init__(self, path, max_bytes):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                key TEXT PRIMARY KEY,
+                                value BLOB NOT NULL,
+                                size INTEGER NOT NULL,
+                                created REAL NOT NULL,
+                                accessed REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+
+    def get(self, key, max_age=None, with_created=False):
+        return self.get_many([key], max_age=max_age, with_created=with_created).get(key)
+
+    def get_many(self, keys, max_age=None, with_created=False):
+        """Return {key: value} for the keys present (and younger than max_age seconds), or {key: (value, created)}."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT key, value, created FROM entries WHERE key IN ({placeholders})", batch).fetchall()
+                for key, value, created in rows:
+                    if max_age is None or now - created <= max_age:
+                        found[key] = (value, created) if with_created else value
+            if found:
+                self._conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """Store items; a value larger than max_bytes is skipped, since storing it would evict everything, itself included."""
+        now = time.time()
+        rows = [(key, sqlite3.Binary(value), len(value), now, now) for key, value in items.items() if len(value) <= self.max_bytes]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def total_bytes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.total_bytes()}
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Free down to 90% of the budget so eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
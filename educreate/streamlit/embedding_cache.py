@@ -0,0 +1,54 @@
+import hashlib
+
+import numpy as np
+
+from disk_cache import DiskCache
+
+DEFAULT_EMBEDDING_CACHE_PATH = "./cache/embeddings.sqlite"
+
+class CachedEmbeddings:
+    """
+    Wrap a LangChain embeddings object with a content-addressed disk cache.
+
+    Vectors are keyed by (model name, SHA-256 of the chunk text), so repeated
+    text, whether overlapping Wikipedia pages within one build or re-chunked
+    corpora across builds, is only embedded once per model.
+    """
+    def __init__(self, embedder, model_name, path=DEFAULT_EMBEDDING_CACHE_PATH, max_bytes=2 * 1024**3):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.cache = DiskCache(path, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts):
+        keys = [self.key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct unseen text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embedder.embed_documents(list(missing.values()))
+            fresh = {key: np.asarray(vector, dtype=np.float32).tobytes() for key, vector in zip(missing, vectors)}
+            self.cache.set_many(fresh)
+            cached.update(fresh)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [np.frombuffer(cached[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_query(self, text):
+        return self.embedder.embed_query(text)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "cache_bytes": self.cache.total_bytes()}
@@ -0,0 +1,40 @@
+import hashlib
+import time
+
+from types import SimpleNamespace
+
+from PIL import Image, ImageDraw
+
+class StubPipeline:
+    """
+    CPU stand-in for StableDiffusion3Pipeline.
+
+    Accepts the same call signature used by generate_panels (single prompts or
+    lists, one generator or one per prompt) and returns flat-coloured images
+    derived from each prompt and generator seed, so batching, seeding and
+    caching logic can be exercised without a GPU. step_seconds simulates the
+    cost of a denoising step for a whole batch.
+    """
+    def __init__(self, step_seconds=0.0):
+        self.step_seconds = step_seconds
+        self.calls = []
+
+    def __call__(self, prompt, negative_prompt_3=None, num_inference_steps=50, height=1024, width=1024, guidance_scale=7.0, generator=None, callback_on_step_end=None, **kwargs):
+        prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        generators = generator if isinstance(generator, list) else [generator] * len(prompts)
+        self.calls.append({"prompts": prompts, "steps": num_inference_steps, "height": height, "width": width})
+
+        for step in range(num_inference_steps):
+            if self.step_seconds:
+                time.sleep(self.step_seconds)
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, None, {})
+
+        images = []
+        for text, gen in zip(prompts, generators):
+            seed = gen.initial_seed() if gen is not None else 0
+            digest = hashlib.sha256(f"{seed}:{text}".encode("utf-8")).digest()
+            image = Image.new("RGB", (width, height), tuple(digest[:3]))
+            ImageDraw.Draw(image).text((10, 10), f"seed {seed}", fill="white")
+            images.append(image)
+        return SimpleNamespace(images=images)
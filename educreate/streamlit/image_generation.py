@@ -0,0 +1,96 @@
+import hashlib
+import json
+import sys
+
+from io import BytesIO
+
+from PIL import Image
+from registry import registry
+
+DEFAULT_PANEL_CACHE_PATH = "./cache/panels.sqlite"
+
+# Preview renders: full resolution but about a quarter of the steps, so a draft of the whole comic costs
+# about 1/4 of the full-quality GPU time. The latent has the same shape and seed as the full render, so a
+# refined panel starts from the same noise as its draft and keeps its composition; a smaller draft would
+# draw different noise and come back as a different picture.
+DRAFT_OPTIONS = {"num_inference_steps": 12}
+
+def panel_generators(panel_indices, seed):
+    torch = registry.module("torch")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return [torch.Generator(device).manual_seed(seed + i) for i in panel_indices]
+
+# Everything that determines the pixels of a panel
+def panel_key(model_id, prompt, negative_prompt, seed, num_inference_steps, height, width, guidance_scale):
+    payload = json.dumps([model_id, prompt, negative_prompt, seed, num_inference_steps, height, width, guidance_scale])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def encode_png(image):
+    buffer = BytesIO()
+    image.save(buffer, format="png")
+    return buffer.getvalue()
+
+def decode_png(data):
+    image = Image.open(BytesIO(data))
+    image.load()
+    return image
+
+def generate_panels(pipe, prompts, negative_prompt, batch_size=2, seed=1924, num_inference_steps=50, height=1024, width=1024, guidance_scale=7.0, on_step=None, cancelled=None, cache=None, model_id="", panels=None):
+    """
+    Generate one image per prompt, batch_size panels per pipeline call.
+
+    Yields (panel_index, image) as each batch finishes. Panel i is always
+    denoised from its own generator seeded with seed + i, so a panel comes out
+    the same whatever the batch size or which other panels are generated with
+    it. on_step(first_panel, step, steps) is called after every denoising step;
+    once cancelled() returns True the running batch is interrupted and nothing
+    more is yielded.
+
+    With a DiskCache as cache, panels are looked up by every generation
+    parameter (including model_id) first; cached panels are yielded straight
+    away and only the rest are batched through the pipeline.
+
+    panels restricts generation to those panel indices (e.g. the panels
+    accepted from a draft); each keeps the seed it has in the full comic.
+    """
+    panels = range(len(prompts)) if panels is None else sorted(panels)
+    keys = {i: panel_key(model_id, prompts[i], negative_prompt, seed + i, num_inference_steps, height, width, guidance_scale)
+            for i in panels}
+    cached = cache.get_many(list(keys.values())) if cache is not None else {}
+    for i, key in keys.items():
+        if key in cached:
+            yield i, decode_png(cached[key])
+
+    missing = [i for i, key in keys.items() if key not in cached]
+    for start in range(0, len(missing), batch_size):
+        if cancelled is not None and cancelled():
+            return
+
+        batch = missing[start:start + batch_size]
+
+        def step_end(pipeline, step, timestep, callback_kwargs):
+            if on_step is not None:
+                on_step(batch[0], step + 1, num_inference_steps)
+            if cancelled is not None and cancelled():
+                pipeline._interrupt = True
+            return callback_kwargs
+
+        images = pipe(prompt=[prompts[i] for i in batch],
+                    negative_prompt_3=[negative_prompt] * len(batch),
+                    num_inference_steps=num_inference_steps,
+                    height=height,
+                    width=width,
+                    guidance_scale=guidance_scale,
+                    generator=panel_generators(batch, seed),
+                    callback_on_step_end=step_end).images
+
+        if cancelled is not None and cancelled():
+            return
+        for i, image in zip(batch, images):
+            if cache is not None:
+                cache.set(keys[i], encode_png(image))
+            yield i, image
+
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
@@ -0,0 +1,164 @@
+import itertools
+import threading
+import time
+import traceback
+
+from collections import deque
+
+from image_generation import generate_panels
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = "queued", "running", "done", "cancelled", "failed"
+FINISHED = (DONE, CANCELLED, FAILED)
+
+class ImageJob:
+    def __init__(self, job_id, prompts, negative_prompt, options):
+        self.id = job_id
+        self.prompts = list(prompts)
+        self.negative_prompt = negative_prompt
+        self.options = options
+        self.state = QUEUED
+        self.images = [None] * len(self.prompts)
+        self.panels_done = 0
+        self.panels = range(len(self.prompts)) if options.get("panels") is None else list(options["panels"])
+        self.step = 0
+        self.steps = options.get("num_inference_steps", 50)
+        self.active_panel = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+class GenerationWorker:
+    """
+    Single background thread that owns the diffusion pipeline.
+
+    Streamlit sessions submit jobs and poll them; jobs run one at a time in
+    submission order, so concurrent teachers queue instead of contending for
+    the GPU. load_pipeline is called once, on the worker thread, so the page
+    that starts the worker does not block on model loading. Any object with
+    the StableDiffusion3Pipeline call signature works, e.g. StubPipeline.
+    Finished panels are stored in cache (a DiskCache) under keys that include
+    model_id, so regenerating an identical panel costs no GPU time. Panels
+    go through the pipeline batch_size at a time unless a job's options set
+    their own batch_size.
+
+    Once a job has finished, the first images() call hands its panels over
+    and the worker drops its own references, so full-resolution images are
+    not held for every recent comic; only keep_finished finished jobs are
+    remembered at all.
+    """
+    def __init__(self, load_pipeline, keep_finished=8, cache=None, model_id="", batch_size=2):
+        self.load_pipeline = load_pipeline
+        self.batch_size = batch_size
+        self.cache = cache
+        self.model_id = model_id
+        self.keep_finished = keep_finished
+        self.pipe = None
+        self.load_error = None
+        self.jobs = {}
+        self._queue = deque()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="image-generation-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompts, negative_prompt, replaces=None, **options):
+        """Queue a job and return its id; the job replaces (e.g. the session's previous comic) is cancelled."""
+        with self._cond:
+            if replaces is not None:
+                self.cancel(replaces)
+            job = ImageJob(f"job-{next(self._ids)}", prompts, negative_prompt, options)
+            self.jobs[job.id] = job
+            self._queue.append(job)
+            self._prune()
+            self._cond.notify()
+        return job.id
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return
+            job.cancel_event.set()
+            if job.state == QUEUED:
+                self._queue.remove(job)
+                self._finish(job, CANCELLED)
+
+    def status(self, job_id):
+        """Snapshot of a job: state, jobs ahead of it, panels finished and step of the current batch."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.state == QUEUED:
+                running = any(other.state == RUNNING for other in self.jobs.values())
+                position = self._queue.index(job) + int(running)
+            else:
+                position = 0
+            panels_done = job.panels_done
+            elapsed = (job.finished or time.time()) - job.started if job.started else 0.0
+            return {"state": job.state,
+                    "position": position,
+                    "panels_done": panels_done,
+                    "panels": len(job.panels),
+                    "active_panel": job.active_panel,
+                    "step": job.step,
+                    "steps": job.steps,
+                    "images_per_minute": panels_done / elapsed * 60 if elapsed > 0 else 0.0,
+                    "error": job.error}
+
+    def images(self, job_id):
+        """Panels finished so far, None for the rest; after the job has finished, only the first call gets them."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return []
+            images = list(job.images)
+            if job.state in FINISHED:
+                job.images = [None] * len(job.images)
+            return images
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished = time.time()
+        job.active_panel = None
+
+    def _prune(self):
+        finished = sorted((job for job in self.jobs.values() if job.state in FINISHED), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job.id]
+
+    def _run(self):
+        try:
+            self.pipe = self.load_pipeline()
+        except Exception:
+            self.load_error = traceback.format_exc()
+
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._queue.popleft()
+                if self.load_error is not None:
+                    self._finish(job, FAILED, self.load_error)
+                    continue
+                job.state = RUNNING
+                job.started = time.time()
+
+            def on_step(panel, step, steps):
+                job.active_panel, job.step, job.steps = panel, step, steps
+
+            try:
+                for i, image in generate_panels(self.pipe, job.prompts, job.negative_prompt,
+                                                on_step=on_step, cancelled=job.cancel_event.is_set,
+                                                cache=self.cache, model_id=self.model_id, **{"batch_size": self.batch_size, **job.options}):
+                    with self._cond:
+                        job.images[i] = image
+                        job.panels_done += 1
+                with self._cond:
+                    self._finish(job, CANCELLED if job.cancel_event.is_set() else DONE)
+            except Exception:
+                with self._cond:
+                    self._finish(job, FAILED, traceback.format_exc())
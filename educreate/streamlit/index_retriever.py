@@ -0,0 +1,45 @@
+from typing import Any, List
+
+from ann_index import DEFAULT_N_PROBE
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+class IndexRetriever(BaseRetriever):
+    """
+    LangChain retriever over a VectorIndex, matching the old Qdrant as_retriever settings.
+
+    MMR re-ranks the fetch_k most similar chunks down to k. On an index with
+    IVF lists, n_probe lists are searched (0 searches every row). Search is
+    dense by default. With hybrid=True (opt-in until bench_hybrid.py shows
+    it helps) the fetch_k candidates come from VectorIndex.hybrid_search,
+    so chunks that name the query's people, places and dates make the cut
+    even when their vectors are not among the nearest; narrow=True lets the
+    BM25 matches limit which chunks are scored densely at all.
+    """
+    index: Any
+    embeddings: Any
+    search_type: str = "mmr"
+    k: int = 8
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    n_probe: int = DEFAULT_N_PROBE
+    hybrid: bool = False
+    lexical_k: int = 100
+    narrow: bool = False
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        query_embedding = self.embeddings.embed_query(query)
+
+        if self.search_type == "mmr":
+            candidates, query_vector = self.search(query, query_embedding, self.fetch_k)
+            rows = self.index.select_mmr(candidates, query_vector, self.k, lambda_mult=self.lambda_mult)
+        else:
+            rows, _ = self.search(query, query_embedding, self.k)
+
+        return [self.index.document(int(row)) for row in rows]
+
+    def search(self, query, query_embedding, k):
+        if self.hybrid:
+            return self.index.hybrid_search(query, query_embedding, k, n_probe=self.n_probe, lexical_k=self.lexical_k, narrow=self.narrow)
+        return self.index.search(query_embedding, k, n_probe=self.n_probe)
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import time
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.document_loaders import WebBaseLoader
+from langchain_community.document_loaders import WikipediaLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from vector_index import VectorIndex, index_ready, write_index
+
+def build_sources(wikipedia_queries, webpage_urls):
+    sources = [("Wikipedia", query) for query in wikipedia_queries]
+    sources += [("Webpage", url) for url in webpage_urls]
+    # Drop repeated entries but keep the order of RAG_inputs.py
+    return list(dict.fromkeys(sources))
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# A source is identified by everything that decides its chunks, so editing a
+# query or the chunking parameters makes it a new source.
+def source_id(source, chunk_size, overlap):
+    return hash_text(json.dumps([source[0], source[1], chunk_size, overlap]))[:16]
+
+# Function to download the raw documents for one (source type, query or url) pair
+def fetch_source(source):
+    source_type, key = source
+    if source_type == "Wikipedia":
+        return WikipediaLoader(query=key, load_max_docs=4).load()
+    elif source_type == "Webpage":
+        return WebBaseLoader(key).load()
+    raise ValueError(f"Unknown source type {source_type}")
+
+def fetch_all(sources, fetch=fetch_source, max_workers=8, doc_nums=None):
+    """
+    Fetch every source on a bounded thread pool.
+
+    Yields (doc_num, source, docs) in source order as soon as each result is
+    available, so chunking and embedding of early sources overlaps with the
+    network I/O of later ones. doc_nums defaults to the position in sources.
+    """
+    doc_nums = range(len(sources)) if doc_nums is None else doc_nums
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for doc_num, source, docs in zip(doc_nums, sources, executor.map(fetch, sources)):
+            yield doc_num, source, docs
+
+def chunk_stream(fetched, chunk_size=512, overlap=50, records=None, known_hashes=None):
+    """
+    Split fetched documents into chunks tagged with doc_num, doc_source and split_id.
+
+    If records is given, the doc_num and document hashes of every source are
+    stored in it. Sources whose hashes equal their entry in known_hashes are
+    marked unchanged and not chunked.
+    """
+    records = {} if records is None else records
+    known_hashes = known_hashes or {}
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
+    for doc_num, source, docs in fetched:
+        doc_hashes = [hash_text(doc.page_content) for doc in docs]
+        unchanged = known_hashes.get(source) == doc_hashes
+        records[source] = {"doc_num": doc_num, "doc_hashes": doc_hashes, "unchanged": unchanged}
+        if unchanged:
+            continue
+
+        source_type = source[0]
+        for doc in docs:
+            doc.metadata['doc_num'] = doc_num
+            doc.metadata['doc_source'] = source_type
+        for split_id, split in enumerate(text_splitter.split_documents(docs)):
+            split.metadata['split_id'] = split_id
+            yield split
+
+def embed_stream(chunks, embedder, batch_size=256):
+    """
+    Embed a stream of chunks in fixed-size batches that span source boundaries.
+
+    Returns (texts, metadatas, embeddings) with embeddings as a float32 matrix.
+    """
+    texts, metadatas, vectors = [], [], []
+    batch = []
+
+    def flush():
+        vectors.extend(embedder.embed_documents([chunk.page_content for chunk in batch]))
+        texts.extend(chunk.page_content for chunk in batch)
+        metadatas.extend(chunk.metadata for chunk in batch)
+        batch.clear()
+
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            flush()
+    if batch:
+        flush()
+
+    return texts, metadatas, np.array(vectors, dtype=np.float32)
+
+def ingest(sources, embedder, fetch=fetch_source, max_workers=8, batch_size=256, chunk_size=512, overlap=50):
+    start = time.perf_counter()
+    fetched = fetch_all(sources, fetch=fetch, max_workers=max_workers)
+    chunks = chunk_stream(fetched, chunk_size=chunk_size, overlap=overlap)
+    texts, metadatas, embeddings = embed_stream(chunks, embedder, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+
+    stats = {"sources": len(sources),
+             "chunks": len(texts),
+             "seconds": seconds,
+             "chunks_per_s": len(texts) / seconds if seconds > 0 else 0.0}
+    return texts, metadatas, embeddings, stats
+
+def build(index_dir, sources, embedder, model_name, fetch=fetch_source, refresh=False, max_workers=8, batch_size=256, chunk_size=512, overlap=50, ann_lists=None, embedding_dtype="float32"):
+    """
+    Bring the index at index_dir up to date with sources.
+
+    The index manifest records every source with its doc_num, document hashes
+    and the split_ids of its chunks. Sources already in the manifest keep their
+    stored chunks and vectors; only added sources are fetched, chunked and
+    embedded, and sources no longer listed are dropped. With refresh=True the
+    known sources are re-fetched too, but only those whose documents changed
+    are re-chunked and re-embedded. An index built with a different embedding
+    model, or without a manifest, is rebuilt from scratch. ann_lists and
+    embedding_dtype are passed to write_index.
+    """
+    start = time.perf_counter()
+    sources = list(dict.fromkeys(sources))
+
+    old_index = None
+    old_manifest = {"sources": {}, "next_doc_num": 0}
+    if index_ready(index_dir):
+        candidate = VectorIndex(index_dir)
+        if candidate.model_name == model_name and candidate.manifest is not None:
+            old_index, old_manifest = candidate, candidate.manifest
+    old_sources = old_manifest["sources"]
+    next_doc_num = old_manifest["next_doc_num"]
+
+    ids = [source_id(source, chunk_size, overlap) for source in sources]
+
+    # Decide which sources need fetching
+    to_fetch, doc_nums, known_hashes = [], [], {}
+    for source, sid in zip(sources, ids):
+        if sid in old_sources:
+            if not refresh:
+                continue
+            doc_nums.append(old_sources[sid]["doc_num"])
+            known_hashes[source] = old_sources[sid]["doc_hashes"]
+        else:
+            doc_nums.append(next_doc_num)
+            next_doc_num += 1
+        to_fetch.append(source)
+
+    records = {}
+    fetched = fetch_all(to_fetch, fetch=fetch, max_workers=max_workers, doc_nums=doc_nums)
+    chunks = chunk_stream(fetched, chunk_size=chunk_size, overlap=overlap, records=records, known_hashes=known_hashes)
+    new_texts, new_metadatas, new_embeddings = embed_stream(chunks, embedder, batch_size=batch_size)
+
+    new_rows = {}
+    for row, metadata in enumerate(new_metadatas):
+        new_rows.setdefault(metadata["doc_num"], []).append(row)
+
+    # Assemble the new index in source order from stored and freshly embedded rows
+    texts, metadatas, blocks = [], [], []
+    manifest = {"sources": {}, "next_doc_num": next_doc_num}
+    stats = {"sources": len(sources), "reused": 0, "added": 0, "changed": 0}
+    for source, sid in zip(sources, ids):
+        record = records.get(source)
+        row_start = len(texts)
+        if record is None or record["unchanged"]:
+            entry = old_sources[sid]
+            old_start, old_stop = entry["rows"]
+            texts.extend(old_index.texts[old_start:old_stop])
+            metadatas.extend(old_index.metadatas[old_start:old_stop])
+            if old_stop > old_start:
+                blocks.append(np.asarray(old_index.embeddings[old_start:old_stop]))
+            doc_num, doc_hashes, split_ids = entry["doc_num"], entry["doc_hashes"], entry["split_ids"]
+            stats["reused"] += 1
+        else:
+            rows = new_rows.get(record["doc_num"], [])
+            texts.extend(new_texts[row] for row in rows)
+            metadatas.extend(new_metadatas[row] for row in rows)
+            if rows:
+                blocks.append(new_embeddings[rows])
+            doc_num, doc_hashes = record["doc_num"], record["doc_hashes"]
+            split_ids = [new_metadatas[row]["split_id"] for row in rows]
+            stats["changed" if sid in old_sources else "added"] += 1
+
+        manifest["sources"][sid] = {"type": source[0],
+                                    "key": source[1],
+                                    "doc_num": doc_num,
+                                    "doc_hashes": doc_hashes,
+                                    "split_ids": split_ids,
+                                    "rows": [row_start, len(texts)]}
+
+    embeddings = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    write_index(index_dir, texts, metadatas, embeddings, model_name, manifest=manifest, ann_lists=ann_lists, embedding_dtype=embedding_dtype)
+
+    seconds = time.perf_counter() - start
+    stats.update({"removed": len(set(old_sources) - set(manifest["sources"])),
+                  "chunks": len(texts),
+                  "chunks_embedded": len(new_texts),
+                  "seconds": seconds,
+                  "chunks_per_s": len(new_texts) / seconds if seconds > 0 else 0.0})
+    return stats
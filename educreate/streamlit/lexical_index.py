@@ -0,0 +1,115 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from collections import Counter
+
+LEXICAL_FILES = ("lexical_terms.json", "lexical_offsets.npy", "lexical_rows.npy", "lexical_counts.npy", "lexical_lengths.npy")
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper and works without tuning
+RRF_K = 60
+
+# Words too common to say anything about a chunk; BM25's idf would mostly discount them anyway
+STOPWORDS = frozenset("a an and are as at be by for from had has have he in is it its of on or that the their this to was were which with".split())
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Lowercased words and numbers, so names and years match exactly ("Khrushchev", "1929")."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def fuse(rankings, k=RRF_K):
+    """Reciprocal rank fusion of best-first row arrays; rows ranked well by several rankings come first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[int(row)] = scores.get(int(row), 0.0) + 1.0 / (k + rank + 1)
+    return np.array(sorted(scores, key=scores.get, reverse=True), dtype=np.int64)
+
+class LexicalIndex:
+    """
+    BM25 inverted index over an index's chunks.
+
+    Postings are stored in CSR form like the IVF lists: for term id t,
+    rows[offsets[t]:offsets[t + 1]] are the (ascending) rows containing it
+    and counts[...] how often. A query only reads the postings of its own
+    terms, so its cost grows with how common those terms are, not with the
+    number of chunks.
+    """
+    def __init__(self, terms, offsets, rows, counts, lengths, k1=1.2, b=0.75):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.counts = counts
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.average_length = max(float(lengths.mean()), 1.0) if len(lengths) else 1.0
+
+    @classmethod
+    def build(cls, texts):
+        vocabulary = {}
+        rows, term_ids, counts = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            for token, count in Counter(tokens).items():
+                rows.append(row)
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                counts.append(count)
+
+        rows = np.array(rows, dtype=np.int32)
+        term_ids = np.array(term_ids, dtype=np.int64)
+        # Group postings by term; rows were appended in order, so a stable sort keeps each list ascending
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))]).astype(np.int64)
+        counts = np.minimum(np.array(counts, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)
+        return cls(vocabulary, offsets, rows[order], counts[order], lengths)
+
+    @classmethod
+    def load(cls, index_dir):
+        terms_name, *array_names = LEXICAL_FILES
+        with open(os.path.join(index_dir, terms_name)) as terms_file:
+            terms = {term: term_id for term_id, term in enumerate(json.load(terms_file))}
+        offsets, rows, counts, lengths = (np.load(os.path.join(index_dir, name), mmap_mode="r") for name in array_names)
+        return cls(terms, np.asarray(offsets), rows, counts, np.asarray(lengths))
+
+    @staticmethod
+    def exists(index_dir):
+        return all(os.path.exists(os.path.join(index_dir, name)) for name in LEXICAL_FILES)
+
+    def save(self, index_dir):
+        terms_name, *array_names = LEXICAL_FILES
+        with open(os.path.join(index_dir, terms_name), "w") as terms_file:
+            # Term ids are insertion order, so the list position is the id
+            json.dump(list(self.terms), terms_file)
+        for name, array in zip(array_names, (self.offsets, self.rows, self.counts, self.lengths)):
+            np.save(os.path.join(index_dir, name), array)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def search(self, query, k):
+        """Rows of the k chunks with the highest BM25 score for query, best first, and their scores."""
+        term_ids = [self.terms[token] for token in dict.fromkeys(tokenize(query)) if token in self.terms]
+        if not term_ids or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows, weights = [], []
+        for term_id in term_ids:
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            term_rows = np.asarray(self.rows[start:stop], dtype=np.int64)
+            counts = np.asarray(self.counts[start:stop], dtype=np.float32)
+            idf = np.log(1 + (len(self) - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[term_rows] / self.average_length)
+            rows.append(term_rows)
+            weights.append(idf * counts * (self.k1 + 1) / (counts + norm))
+
+        # Sum each row's per-term scores without a dense array the size of the index
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+        k = min(k, len(matched))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return matched[top], scores[top]
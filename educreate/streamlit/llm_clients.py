@@ -0,0 +1,318 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+from collections import namedtuple
+
+from registry import registry
+
+# Requests in flight and requests per minute allowed per provider, shared by every session in the process
+ProviderLimits = namedtuple("ProviderLimits", ["max_concurrency", "requests_per_minute"])
+DEFAULT_LIMITS = {"OpenAI": ProviderLimits(16, 500), "Anthropic": ProviderLimits(8, 50)}
+
+# Timeouts, conflicts, rate limits and server errors are retried; 529 is Anthropic's "overloaded"
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRY_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+def is_retryable(error):
+    return type(error).__name__ in RETRY_ERRORS or getattr(error, "status_code", None) in RETRY_STATUSES
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, if it sent a Retry-After header."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Thread-safe token bucket: requests_per_minute on average, bursts of up to burst requests."""
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1, requests_per_minute // 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+class LLMClients:
+    """
+    Process-wide pool of OpenAI and Anthropic clients.
+
+    SDK clients are created once per API key on one pooled httpx client per
+    provider, so connections and TLS sessions are reused across calls and
+    sessions. The LangChain OpenAI chat model shares the same pool;
+    ChatAnthropic cannot be given an httpx client and keeps its own
+    connections. Every request goes through call() (or stream_call(), or
+    acall() for asyncio code), which applies the provider's concurrency limit and rate limit and retries rate limits,
+    timeouts and server errors with jittered exponential backoff, honouring
+    Retry-After. The SDKs' own retries are turned off so the policy is
+    applied once.
+
+    base_urls (default: OPENAI_BASE_URL and ANTHROPIC_BASE_URL) can point
+    both providers at a local stub server such as llm_stub_server.py.
+    """
+    def __init__(self, limits=None, retries=4, backoff=1.0, timeout=120.0, base_urls=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.base_urls = {"OpenAI": os.environ.get("OPENAI_BASE_URL"), "Anthropic": os.environ.get("ANTHROPIC_BASE_URL")}
+        self.base_urls.update(base_urls or {})
+        self.stats = {provider: {"requests": 0, "retries": 0, "failures": 0} for provider in self.limits}
+
+        self._semaphores = {provider: threading.BoundedSemaphore(limit.max_concurrency) for provider, limit in self.limits.items()}
+        self._rate_limiters = {provider: RateLimiter(limit.requests_per_minute) for provider, limit in self.limits.items()}
+        self._http = {}
+        self._clients = {}
+        self._chat_models = {}
+        # httpx async connections and asyncio semaphores belong to the event loop that created them
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._loop_semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+
+    def _http_options(self, provider):
+        httpx = registry.module("httpx")
+        limit = self.limits[provider].max_concurrency
+        return {"timeout": self.timeout, "limits": httpx.Limits(max_connections=limit, max_keepalive_connections=limit)}
+
+    def _sdk(self, provider, asynchronous=False):
+        if provider == "OpenAI":
+            openai = registry.module("openai")
+            return openai.AsyncOpenAI if asynchronous else openai.OpenAI
+        anthropic = registry.module("anthropic")
+        return anthropic.AsyncAnthropic if asynchronous else anthropic.Anthropic
+
+    def http_client(self, provider):
+        with self._lock:
+            if provider not in self._http:
+                self._http[provider] = registry.module("httpx").Client(**self._http_options(provider))
+            return self._http[provider]
+
+    def client(self, provider, api_key):
+        with self._lock:
+            key = (provider, api_key)
+            if key not in self._clients:
+                self._clients[key] = self._sdk(provider)(api_key=api_key, base_url=self.base_urls[provider],
+                                                         http_client=self.http_client(provider), max_retries=0)
+            return self._clients[key]
+
+    def async_client(self, provider, api_key):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            if provider not in clients:
+                clients[provider] = registry.module("httpx").AsyncClient(**self._http_options(provider))
+            if (provider, api_key) not in clients:
+                clients[(provider, api_key)] = self._sdk(provider, asynchronous=True)(api_key=api_key, base_url=self.base_urls[provider],
+                                                                                     http_client=clients[provider], max_retries=0)
+            return clients[(provider, api_key)]
+
+    def chat_model(self, provider, api_key, model, **params):
+        """Shared LangChain chat model; run chains that use it through call() to apply the limits and retries."""
+        with self._lock:
+            key = (provider, api_key, model, tuple(sorted(params.items())))
+            if key not in self._chat_models:
+                base_url = self.base_urls[provider]
+                if provider == "OpenAI":
+                    ChatOpenAI = registry.module("langchain_openai").ChatOpenAI
+                    self._chat_models[key] = ChatOpenAI(api_key=api_key, model=model, base_url=base_url,
+                                                        http_client=self.http_client(provider), max_retries=0, **params)
+                else:
+                    ChatAnthropic = registry.module("langchain_anthropic").ChatAnthropic
+                    self._chat_models[key] = ChatAnthropic(anthropic_api_key=api_key, model=model, max_retries=0,
+                                                           **({"anthropic_api_url": base_url} if base_url else {}), **params)
+            return self._chat_models[key]
+
+    def _count(self, provider, name):
+        with self._lock:
+            self.stats[provider][name] += 1
+
+    def _retry_delay(self, provider, error, attempt):
+        if attempt == self.retries or not is_retryable(error):
+            self._count(provider, "failures")
+            return None
+        self._count(provider, "retries")
+        delay = retry_after(error)
+        if delay is None:
+            delay = self.backoff * 2**attempt + random.uniform(0, self.backoff)
+        print(f"{provider} request failed ({error!r}), retrying in {delay:.1f}s")
+        return delay
+
+    def call(self, provider, request, *args, **kwargs):
+        """Run request(*args, **kwargs), one provider request, under the provider's limits and retry policy."""
+        for attempt in range(self.retries + 1):
+            self._rate_limiters[provider].acquire()
+            with self._semaphores[provider]:
+                self._count(provider, "requests")
+                try:
+                    return request(*args, **kwargs)
+                except Exception as error:
+                    delay = self._retry_delay(provider, error, attempt)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+
+    def stream_call(self, provider, request, *args, **kwargs):
+        """
+        call() for streaming requests: request(*args, **kwargs) returns an
+        iterable whose items are yielded as they arrive. The provider's
+        concurrency slot is held until the stream ends or is closed. Only
+        failures before the first item are retried, since what has been
+        shown cannot be taken back.
+        """
+        for attempt in range(self.retries + 1):
+            self._rate_limiters[provider].acquire()
+            with self._semaphores[provider]:
+                self._count(provider, "requests")
+                started = False
+                try:
+                    for item in request(*args, **kwargs):
+                        started = True
+                        yield item
+                    return
+                except Exception as error:
+                    if started:
+                        self._count(provider, "failures")
+                        raise
+                    delay = self._retry_delay(provider, error, attempt)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+
+    def _loop_semaphore(self, provider):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._loop_semaphores.setdefault(loop, {})
+            if provider not in semaphores:
+                semaphores[provider] = asyncio.Semaphore(self.limits[provider].max_concurrency)
+            return semaphores[provider]
+
+    async def _acquire_slot(self, provider, poll=0.005, max_poll=0.1):
+        """
+        Take one of the provider's slots, which are shared with threads,
+        without blocking the event loop. The slot is taken in this coroutine,
+        only between awaits, so a cancelled wait never holds one.
+        """
+        semaphore = self._semaphores[provider]
+        while not semaphore.acquire(blocking=False):
+            await asyncio.sleep(poll)
+            poll = min(poll * 2, max_poll)
+
+    async def acall(self, provider, request, *args, **kwargs):
+        """
+        Async call(): request(*args, **kwargs) returns an awaitable.
+
+        Coroutines on one event loop queue on an asyncio.Semaphore of the
+        provider's size, then take a slot from the limit shared with the
+        threads, so threaded and async requests together stay within it.
+        """
+        semaphore = self._semaphores[provider]
+        for attempt in range(self.retries + 1):
+            await asyncio.sleep(self._rate_limiters[provider].reserve())
+            async with self._loop_semaphore(provider):
+                await self._acquire_slot(provider)
+                try:
+                    self._count(provider, "requests")
+                    return await request(*args, **kwargs)
+                except Exception as error:
+                    delay = self._retry_delay(provider, error, attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    semaphore.release()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _request_options(provider, model, messages, system, max_tokens, params):
+        if provider == "OpenAI":
+            messages = ([{"role": "system", "content": system}] if system else []) + list(messages)
+            options = {"model": model, "messages": messages}
+            if max_tokens is not None:
+                options["max_tokens"] = max_tokens
+        else:
+            # Anthropic requires max_tokens, and takes the system prompt separately
+            options = {"model": model, "messages": list(messages), "max_tokens": max_tokens or 2048}
+            if system:
+                options["system"] = system
+        options.update(params)
+        return options
+
+    @staticmethod
+    def _text(provider, response):
+        if provider == "OpenAI":
+            return response.choices[0].message.content
+        return response.content[0].text
+
+    @staticmethod
+    def _delta(provider, event):
+        if provider == "OpenAI":
+            return event.choices[0].delta.content if event.choices else None
+        if event.type == "content_block_delta" and event.delta.type == "text_delta":
+            return event.delta.text
+        return None
+
+    @staticmethod
+    def _create(provider, client):
+        return client.chat.completions.create if provider == "OpenAI" else client.messages.create
+
+    def complete(self, provider, api_key, model, messages, system=None, max_tokens=None, **params):
+        """
+        One chat completion, returning the reply text.
+
+        messages use the {"role": ..., "content": ...} format both providers
+        accept; system is sent the way the provider expects it. Extra
+        params (temperature, ...) are passed to the SDK.
+        """
+        create = self._create(provider, self.client(provider, api_key))
+        response = self.call(provider, create, **self._request_options(provider, model, messages, system, max_tokens, params))
+        return self._text(provider, response)
+
+    def stream(self, provider, api_key, model, messages, system=None, max_tokens=None, **params):
+        """complete() as a generator of text pieces, yielded as the provider sends them."""
+        create = self._create(provider, self.client(provider, api_key))
+        options = self._request_options(provider, model, messages, system, max_tokens, params)
+
+        def request():
+            for event in create(stream=True, **options):
+                text = self._delta(provider, event)
+                if text:
+                    yield text
+
+        return self.stream_call(provider, request)
+
+    async def acomplete(self, provider, api_key, model, messages, system=None, max_tokens=None, **params):
+        """complete() for asyncio code, on a client pool owned by the running event loop."""
+        create = self._create(provider, self.async_client(provider, api_key))
+        response = await self.acall(provider, create, **self._request_options(provider, model, messages, system, max_tokens, params))
+        return self._text(provider, response)
+
+    def transcribe(self, api_key, model, audio_file):
+        client = self.client("OpenAI", api_key)
+
+        def request():
+            # A failed attempt may have read part of the file
+            audio_file.seek(0)
+            return client.audio.transcriptions.create(model=model, file=audio_file)
+
+        return self.call("OpenAI", request).text
+
+registry.register("llm_clients", LLMClients)
+
+def llm_clients():
+    """The process-wide LLMClients."""
+    return registry.get("llm_clients")
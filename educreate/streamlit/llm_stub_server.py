@@ -0,0 +1,123 @@
+# Local stand-in for the OpenAI and Anthropic HTTP APIs, for exercising llm_clients and the pages without
+# API keys or cost. Point the app at it with
+#   OPENAI_BASE_URL=http://localhost:8089/v1 ANTHROPIC_BASE_URL=http://localhost:8089 streamlit run "Welcome to EduCreate.py"
+# --fail-every N answers every Nth request with a 429, to watch the retry and backoff policy at work.
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+comic_script = {
+    "character": "a young scribe in a linen tunic",
+    "context": "Ancient Egypt, 1300 BC",
+    "script": [f"{{character}} at work, scene {i}" for i in range(1, 7)],
+    "caption": [f"{i}. Stub caption for panel {i}." for i in range(1, 7)],
+    "title": "Stub Comic",
+}
+
+def reply_text(system, messages):
+    if '"script"' in system and '"caption"' in system:
+        return json.dumps(comic_script)
+    last = messages[-1]["content"] if messages else ""
+    if isinstance(last, list):
+        last = " ".join(part.get("text", "") for part in last)
+    return f"Stub reply to: {last[:80]}"
+
+def pieces(text):
+    # Word-sized deltas that join back into exactly the reply text
+    return re.findall(r"\s*\S+", text)
+
+class StubHandler(BaseHTTPRequestHandler):
+    counter = itertools.count(1)
+    lock = threading.Lock()
+    fail_every = 0
+    latency = 0.0
+    token_delay = 0.02
+
+    def send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, events):
+        # Server-sent events, one word at a time, as the SDKs' stream=True expects
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for name, payload in events:
+            if name:
+                self.wfile.write(f"event: {name}\n".encode("utf-8"))
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.token_delay)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            number = next(self.counter)
+        time.sleep(self.latency)
+        if self.fail_every and number % self.fail_every == 0:
+            return self.send_json(429, {"error": {"type": "rate_limit_error", "message": "stub rate limit"}}, [("retry-after", "0.5")])
+
+        if self.path.endswith("/audio/transcriptions"):
+            return self.send_json(200, {"text": f"Stub transcript of {len(body)} bytes of audio."})
+
+        request = json.loads(body or b"{}")
+        messages = request.get("messages", [])
+        if self.path.endswith("/chat/completions"):
+            system = " ".join(message["content"] for message in messages if message["role"] == "system")
+            text = reply_text(system, [message for message in messages if message["role"] != "system"])
+            if request.get("stream"):
+                chunk = {"id": f"chatcmpl-stub-{number}", "object": "chat.completion.chunk", "created": int(time.time()), "model": request.get("model")}
+                return self.send_events([(None, dict(chunk, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+                                         for piece in pieces(text)]
+                                        + [(None, dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])), (None, "[DONE]")])
+            return self.send_json(200, {
+                "id": f"chatcmpl-stub-{number}", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}})
+        if self.path.endswith("/messages"):
+            system = request.get("system") or ""
+            message = {"id": f"msg_stub_{number}", "type": "message", "role": "assistant", "model": request.get("model"),
+                       "content": [{"type": "text", "text": reply_text(system, messages)}],
+                       "stop_reason": "end_turn", "stop_sequence": None, "usage": {"input_tokens": 0, "output_tokens": 0}}
+            if request.get("stream"):
+                text = message["content"][0]["text"]
+                return self.send_events(
+                    [("message_start", {"type": "message_start", "message": dict(message, content=[], stop_reason=None)}),
+                     ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})]
+                    + [("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})
+                       for piece in pieces(text)]
+                    + [("content_block_stop", {"type": "content_block_stop", "index": 0}),
+                       ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 0}}),
+                       ("message_stop", {"type": "message_stop"})])
+            return self.send_json(200, message)
+        self.send_json(404, {"error": {"type": "not_found_error", "message": self.path}})
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI and Anthropic API server.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth request with a 429")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed words")
+    args = parser.parse_args()
+
+    StubHandler.fail_every = args.fail_every
+    StubHandler.latency = args.latency
+    StubHandler.token_delay = args.token_delay
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"Stub LLM server on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
-import easyocr
 import os
-import pymupdf
+import time
 import streamlit as st
 
 
-from comic_poc import style_list, setup_pipeline, create_story_prompt, create_image_prompts, create_images, create_comic_strip, initialize_session
+from comic_export import EXPORT_FORMATS, encode_to_budget, make_preview
+from comic_poc import style_list, setup_pipeline, create_story_prompt, create_image_prompts, ComicCanvas, initialize_session, get_response_cache
+from image_generation import DRAFT_OPTIONS
 from keys import huggingface_token, anthropic_token, openai_token
+from response_cache import hash_text, response_key
+from upload_index import UploadIndex
+from upload_ingest import read_upload
 from streamlit.runtime.scriptrunner.script_run_context import get_script_run_ctx
-from io import BytesIO
 from PIL import Image
 
 st.set_page_config(page_title = "Comic Generator")
@@ -20,20 +23,38 @@ st.sidebar.success("""
     3. (Optional) Upload a file that is aligned to your lesson objective to provide additional specific information to the language model.
     4. Select the large language model.
     5. Click the 'Generate Text' button to generate a written summary of the lesson objective.
-    6. Click the 'Generate Comic' button to generate a comic based on the lesson objective. 
+    6. Click the 'Generate Comic' button to generate a comic based on the lesson objective. With the draft option on, a quick preview comes first: choose the panels to keep and click 'Refine comic' to render them at full quality.
     7. Select the output type for the text summary.
     8. Click the "Download Text" button to save a local copy of the text summary. 
-    9. Click the "Download Comic" button to save a local copy of the comic. 
+    9. Choose a download format and size limit, click the "Prepare Comic Download" button and then the "Download Comic" button to save a local copy of the comic. 
     10. If you'd like to change the style of comic generated for a given lesson objective, return to steps 4 and 5 and regenerate the text before clicking again on generate comic.
 """)
 
+def new_comic_canvas(captions):
+    # Lay out the strip up front so panels can be composited as soon as they finish
+    captions = list(captions)
+    num_panels = len(captions)
+    if num_panels % 2 == 1:
+        captions.append("")
+
+    font_path = os.getcwd() + '/ComicNeue-BoldItalic.ttf'
+    panels_horizontal = len(captions)//2
+    panels_vertical = 2
+    comic_canvas = ComicCanvas(captions, image_width = 1024,  image_height = 1024, panels_horizontal=panels_horizontal, panels_vertical=panels_vertical, border_size=10, text_height=150, font_path=font_path, font_size=30)
+    if num_panels % 2 == 1:
+        ec_path = os.getcwd() + "/EduCreate.png"
+        comic_canvas.add_panel(num_panels, Image.open(ec_path))
+    return comic_canvas
+
 def main():
     
     ctx = get_script_run_ctx()
 
     initialize_session(ctx.session_id, anthropic_token, openai_token)
 
-    pipe, rag_retriever = setup_pipeline(huggingface_token)
+    models = setup_pipeline(huggingface_token)
+    worker = models.get("generation_worker")
+    response_cache = get_response_cache()
 
     lesson_objective = st.text_area(
         "1️⃣ Main lesson objective",
@@ -58,7 +79,7 @@ def main():
         horizontal = True
     )
 
-    uploaded_file = st.file_uploader('3️⃣ (Optional) Upload a file', type = ['pdf', 'txt', 'jpg'])
+    uploaded_file = st.file_uploader('3️⃣ (Optional) Upload a file', type = ['pdf', 'txt', 'jpg', 'jpeg'])
 
     negative_prompt = style_list.get(comic_style).get('negative_prompt')
     style_prompt = style_list.get(comic_style).get('prompt')
@@ -76,57 +97,142 @@ def main():
         OpenAI GPT-4o"""
     )
 
-    if uploaded_file is not None:
-        text = ""
-        suffix = uploaded_file.name[-3:]
-        if suffix == 'pdf':
-            doc = pymupdf.open(stream=uploaded_file.read(), filetype='pdf')
-            for page in doc:
-                text += page.get_text()
-        elif suffix == 'jpg' or suffix == 'jpeg':
-            image_bytes = uploaded_file.read()
-            image_reader = easyocr.Reader(["en"])
-            image_results = image_reader.readtext(image_bytes)
-            text = " ".join(result[1] for result in image_results)
-        elif suffix == 'txt':
-            text = uploaded_file.read()
+    # Extracted once per distinct file; reruns reuse the text
+    st.session_state.text = read_upload(uploaded_file) if uploaded_file is not None else ""
 
     prompt_button = col5.button("5️⃣ Generate Text", key = 'pbutton')
+    summary_shown = False
     
     if prompt_button:
         if len(lesson_objective) <= 5:
             st.error('Please enter a lesson objective into the text box!', icon="🚨")
         else:
-            summ_response = create_story_prompt(rag_retriever, st.session_state['token_dict'][model_type], lesson_objective, st.session_state.text, model_type)
-            captions, combined_prompt = create_image_prompts(st.session_state['token_dict'][model_type], summ_response, style_prompt, model_type)
+            token = st.session_state['token_dict'][model_type]
+
+            # A cached story needs neither the history index nor the embedding model, so load them only on a miss
+            story_key = response_key("story_prompt", model_type, lesson_objective, hash_text(st.session_state.text))
+            summ_response = response_cache.get(story_key)
+            if summ_response is None:
+                if not models.loaded("history_retriever"):
+                    with st.spinner("Loading the history index"):
+                        models.get("history_retriever")
+                rag_retriever = models.get("history_retriever")
+
+                # The upload is indexed once per session and file; only its closest passages reach the prompt
+                upload_index = None
+                if st.session_state.text:
+                    upload_key = hash_text(st.session_state.text)
+                    if st.session_state.get('upload_index_key') != upload_key:
+                        with st.spinner("Indexing the uploaded file"):
+                            st.session_state.upload_index = UploadIndex(st.session_state.text, rag_retriever.embeddings)
+                        st.session_state.upload_index_key = upload_key
+                    upload_index = st.session_state.upload_index
+
+                # Show the summary as it is written, then keep the full text for the cache and the download
+                prompt_stats = {}
+                summ_response = st.write_stream(create_story_prompt(rag_retriever, token, lesson_objective, upload_index, model_type, stream=True, prompt_stats=prompt_stats))
+                response_cache.set(story_key, summ_response)
+                summary_shown = True
+                if upload_index is not None:
+                    whole_upload_tokens = prompt_stats['prompt_tokens'] - prompt_stats['upload_tokens'] + prompt_stats['upload_total_tokens']
+                    st.caption(f"Prompt: {prompt_stats['prompt_tokens']:,} tokens with the {prompt_stats['upload_passages']} most relevant of {len(upload_index)} upload passages "
+                               f"({whole_upload_tokens:,} tokens with the whole upload)")
+            image_key = response_key("image_prompts", model_type, hash_text(summ_response), comic_style)
+            with st.spinner("Writing the comic script"):
+                captions, combined_prompt = response_cache.get_or_create(image_key,
+                    lambda: create_image_prompts(token, summ_response, style_prompt, model_type))
             st.session_state.summ_response = summ_response
             st.session_state.captions = captions
             st.session_state.combined_prompt = combined_prompt
 
+    draft_first = st.checkbox("Draft a quick preview first", key="draft_first", value=True,
+        help="Drafts take a fraction of the time of full-quality panels. Once you are happy with the style and story, choose which panels to render at full quality.")
+
     if col6.button("6️⃣ Generate Comic"):
         if len(st.session_state['captions']) <= 5:
             st.error('Please first generate text!', icon="🚨")
         else:
-            captions = st.session_state.captions
-            combined_prompt = st.session_state.combined_prompt
+            # Diffusion runs on the shared generation worker; this run only queues the job
+            options = DRAFT_OPTIONS if draft_first else {}
+            st.session_state.comic_job = worker.submit(st.session_state.combined_prompt, negative_prompt,
+                                                       replaces=st.session_state.get('comic_job'), **options)
+            st.session_state.comic_job_draft = draft_first
+            st.session_state['job_images'] = {}
+            st.session_state.comic_canvas = new_comic_canvas(st.session_state.captions)
+            st.session_state['draft_images'] = None
 
-            images = create_images(combined_prompt, pipe, negative_prompt)
+    job_id = st.session_state.get('comic_job')
+    job_status = worker.status(job_id) if job_id is not None else None
+    if job_id is not None and job_status is None:
+        del st.session_state['comic_job']
+    if job_status is not None:
+        # Composite every panel the worker has finished since the last poll. The session keeps its own
+        # references, since the worker drops them once it has handed over a finished job's images
+        comic_canvas = st.session_state.comic_canvas
+        job_images = st.session_state.setdefault('job_images', {})
+        for i, image in enumerate(worker.images(job_id)):
+            if image is not None and i not in job_images:
+                job_images[i] = image
+            if image is not None and i not in comic_canvas.thumbnails:
+                comic_canvas.add_panel(i, image)
 
-            font_path = os.getcwd() + '/ComicNeue-BoldItalic.ttf'
-            ec_path = os.getcwd() + "/EduCreate.png"
-            ec_logo = Image.open(ec_path)
-            if len(images) % 2 == 1:
-                images.append(ec_logo)
-                captions.append("")
+    if job_status is not None and job_status['state'] in ('queued', 'running'):
+        if job_status['state'] == 'queued':
+            st.info(f"Waiting for the image generator: {job_status['position']} comic(s) ahead of yours", icon="⏳")
+        else:
+            done = min(job_status['panels_done'] + job_status['step'] / job_status['steps'], job_status['panels'])
+            st.progress(done / job_status['panels'],
+                        f"Generating panel {job_status['panels_done'] + 1} of {job_status['panels']} (step {job_status['step']}/{job_status['steps']})")
+        panel_columns = st.columns(comic_canvas.panels_horizontal)
+        for i in sorted(comic_canvas.thumbnails):
+            panel_columns[i % comic_canvas.panels_horizontal].image(comic_canvas.thumbnails[i])
+        if st.button("Cancel comic"):
+            worker.cancel(job_id)
+    elif job_status is not None and job_status['state'] == 'done' and st.session_state.comic_job_draft:
+        del st.session_state['comic_job']
+        # Keep the drafts, with the prompts they were drawn from, until the teacher refines or redrafts
+        st.session_state['draft_images'] = [job_images.get(i) for i in range(len(st.session_state.combined_prompt))]
+        st.session_state['draft_prompts'] = list(st.session_state.combined_prompt)
+        st.session_state['draft_preview'] = make_preview(comic_canvas.image)
+    elif job_status is not None and job_status['state'] == 'done':
+        del st.session_state['comic_job']
+        st.session_state['draft_images'] = None
+        st.caption(f"Generated {job_status['panels']} panels ({job_status['images_per_minute']:.2f} images/min)")
+        st.session_state.comic_strip = comic_canvas.image
+        # Only a small preview is encoded now; the download is encoded on request
+        st.session_state['comic_preview'] = make_preview(comic_canvas.image)
+        st.session_state['comic_version'] += 1
+        st.session_state['comic_output'] = ""
+        st.session_state['comic_output_key'] = None
+    elif job_status is not None:
+        del st.session_state['comic_job']
+        if job_status['state'] == 'failed':
+            st.error('Comic generation failed, please try again.', icon="🚨")
+            if job_status['error']:
+                with st.expander("Error details"):
+                    st.code(job_status['error'], language=None)
 
-            panels_horizontal = len(images)//2
-            panels_vertical = 2
-            comic_strip = create_comic_strip(images, captions, image_width = 1024,  image_height = 1024, panels_horizontal=panels_horizontal, panels_vertical=panels_vertical, border_size=10, text_height=150, font_path=font_path, font_size=30)
-            st.session_state.comic_strip = comic_strip
-            buf = BytesIO()
-            st.session_state['comic_strip'].save(buf, format="png")
-            st.session_state['comic_output'] = buf.getvalue()
+    if job_status is not None and job_status['state'] not in ('queued', 'running'):
+        # The panels now live in the canvas (and the drafts, if any)
+        st.session_state['job_images'] = {}
 
+    draft_images = st.session_state.get('draft_images')
+    if draft_images and 'comic_job' not in st.session_state and st.session_state.get('draft_prompts') == list(st.session_state.combined_prompt):
+        st.image(st.session_state['draft_preview'], caption=f"Draft preview ({DRAFT_OPTIONS['num_inference_steps']} steps)")
+        panel_numbers = list(range(1, len(draft_images) + 1))
+        accepted = st.multiselect("Panels to render at full quality (the rest keep their draft)", options=panel_numbers, default=panel_numbers, key="accepted_panels")
+        if st.button("Refine comic", disabled=not accepted):
+            panels = [number - 1 for number in accepted]
+            st.session_state.comic_job = worker.submit(st.session_state.combined_prompt, negative_prompt,
+                                                       replaces=st.session_state.get('comic_job'), panels=panels)
+            st.session_state.comic_job_draft = False
+            st.session_state['job_images'] = {}
+            comic_canvas = new_comic_canvas(st.session_state.captions)
+            for i, image in enumerate(draft_images):
+                if i not in panels:
+                    comic_canvas.add_panel(i, image)
+            st.session_state.comic_canvas = comic_canvas
+            st.rerun()
 
     text_type = col4.radio(
         "7️⃣ Select text output",
@@ -141,14 +247,48 @@ def main():
         file_name = "Summary document." + text_type,
         mime=text_type)
 
-    col8.download_button(
-        label = "9️⃣ Download Comic", 
-        data = st.session_state['comic_output'],
-        file_name = "Historical_comic.png",
-        mime="image/png")
-    
-    st.write(st.session_state.comic_strip)
-    st.write(st.session_state.summ_response)
+    cache_stats = response_cache.stats()
+    st.sidebar.caption(f"Response cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits "
+                       f"({cache_stats['memory_hits']} memory, {cache_stats['disk_hits']} disk), {cache_stats['misses']} misses")
+    with st.sidebar.expander("Startup timings"):
+        st.table([{"what": f"{kind} {name}", "seconds": round(seconds, 2)} for kind, name, seconds in models.report()])
+
+    if st.session_state['comic_preview']:
+        st.image(st.session_state['comic_preview'])
+
+        export_col1, export_col2 = st.columns(2)
+        comic_format = export_col1.radio("Comic download format", key="comic_format", options=list(EXPORT_FORMATS), horizontal = True)
+        comic_budget = export_col2.number_input("Maximum comic download size (MB)", key="comic_budget", min_value=0.5, max_value=50.0, value=8.0, step=0.5)
+        extension, mime, _ = EXPORT_FORMATS[comic_format]
+
+        # Encode the full-resolution strip only when the teacher asks for it
+        output_key = (st.session_state['comic_version'], comic_format, comic_budget)
+        if st.session_state['comic_output_key'] == output_key:
+            col8.download_button(
+                label = "9️⃣ Download Comic",
+                data = st.session_state['comic_output'],
+                file_name = "Historical_comic." + extension,
+                mime=mime)
+        elif col8.button("9️⃣ Prepare Comic Download"):
+            with st.spinner("Encoding comic"):
+                st.session_state['comic_output'] = encode_to_budget(st.session_state.comic_strip, comic_format, int(comic_budget * 1024**2))
+            st.session_state['comic_output_key'] = output_key
+            st.rerun()
+    else:
+        col8.download_button(
+            label = "9️⃣ Download Comic",
+            data = st.session_state['comic_output'],
+            file_name = "Historical_comic.png",
+            mime="image/png",
+            disabled=True)
+
+    if not summary_shown:
+        st.write(st.session_state.summ_response)
+
+    # Poll the generation worker until the queued comic finishes
+    if 'comic_job' in st.session_state:
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -46,9 +46,7 @@ def main():
     col1, col2 = st.columns([3,7])
 
     if col1.button("Transcribe video"):
-        transcription = extract(video_type, url, text)
-        st.session_state['transcription'] = transcription
-        st.write(transcription)
+        st.session_state['transcription'] = st.write_stream(extract(video_type, url, text, stream=True))
     
     col2.download_button(
         label = "Download Lesson Plan", 
@@ -44,10 +44,21 @@ def main():
 
     col1, col2 = st.columns([3,7])
 
+    plan_shown = False
     if col1.button("4️⃣ Generate Lesson Plan"):
-        transcription = extract(video_type, url, text)
-        st.session_state['transcription'] = transcription
-        st.write(transcription)
+        progress_bar = st.progress(0, "Transcribing video")
+        def on_progress(done, total):
+            progress_bar.progress(done / total, f"Transcribed {done} of {total} segments")
+        upload_stats = {}
+        lesson_plan = extract(video_type, url, text, on_progress=on_progress, stats=upload_stats, stream=True)
+        progress_bar.empty()
+        if upload_stats['cached']:
+            st.caption("Reused the stored transcript of this video")
+        else:
+            st.caption(f"Uploaded {upload_stats['bytes_uploaded'] / 1024**2:.1f} MB of audio in {upload_stats['segments']} segments")
+        # Render the plan as it is written; the full text is kept for the download
+        st.session_state['transcription'] = st.write_stream(lesson_plan)
+        plan_shown = True
     
     col2.download_button(
         label = "5️⃣ Download Lesson Plan", 
@@ -55,6 +66,7 @@ def main():
         file_name = "Lesson plan.txt",
         mime="text")
 
-    st.write(st.session_state['transcription'])
+    if not plan_shown:
+        st.write(st.session_state['transcription'])
 if __name__ == "__main__":
     main()
\ No newline at end of file
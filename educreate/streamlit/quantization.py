@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+
+# Storage types for the copy of the embeddings that search scans; float32 means no extra copy
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+def quantized_files(dtype):
+    return [f"embeddings_{dtype}.npy"] + (["embeddings_int8_scales.npy"] if dtype == "int8" else [])
+
+def read_rows(array, rows):
+    """
+    Copy rows of a memory-mapped array by reading its file rather than its mapping.
+
+    Rescoring touches a few scattered float32 rows per query. Faulting them
+    in through the mapping can map whole large folios around each one, so
+    the full-precision matrix ends up resident after all; pread only copies
+    the bytes asked for.
+    """
+    row_bytes = array.strides[0]
+    out = np.empty((len(rows),) + array.shape[1:], dtype=array.dtype)
+    buffer = memoryview(out).cast("B")
+    fd = os.open(array.filename, os.O_RDONLY)
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_RANDOM)
+        for i, row in enumerate(rows):
+            os.preadv(fd, [buffer[i * row_bytes:(i + 1) * row_bytes]], array.offset + int(row) * row_bytes)
+    finally:
+        os.close(fd)
+    return out
+
+def quantize_block(block, dtype):
+    """(codes, scales) for a block of float32 rows; int8 is symmetric per row, float16 has no scales."""
+    if dtype == "float16":
+        return block.astype(np.float16), None
+    scales = np.abs(block).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(block / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+def save_quantized(index_dir, vectors, dtype, batch_size=65536):
+    """Write the dtype copy of vectors next to them, batch_size rows at a time."""
+    codes_path, *scales_path = (os.path.join(index_dir, name) for name in quantized_files(dtype))
+    codes = np.lib.format.open_memmap(codes_path, mode="w+", dtype=dtype, shape=vectors.shape)
+    scales = np.lib.format.open_memmap(scales_path[0], mode="w+", dtype=np.float32, shape=(len(vectors),)) if scales_path else None
+    for start in range(0, len(vectors), batch_size):
+        block_codes, block_scales = quantize_block(np.asarray(vectors[start:start + batch_size], dtype=np.float32), dtype)
+        codes[start:start + len(block_codes)] = block_codes
+        if scales is not None:
+            scales[start:start + len(block_codes)] = block_scales
+    codes.flush()
+    if scales is not None:
+        scales.flush()
+
+class QuantizedMatrix:
+    """
+    float16 or int8 copy of an embedding matrix, memory-mapped.
+
+    Scores are approximate (float16 keeps about 3 significant digits, int8
+    about 2), so callers shortlist with scores() and rescore the shortlist
+    with the full-precision rows.
+    """
+    def __init__(self, codes, scales=None):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def load(cls, index_dir, dtype):
+        codes, *scales = (np.load(os.path.join(index_dir, name), mmap_mode="r") for name in quantized_files(dtype))
+        return cls(codes, scales[0] if scales else None)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def rows(self, rows):
+        block = np.asarray(self.codes[rows], dtype=np.float32)
+        return block * self.scales[rows][:, None] if self.scales is not None else block
+
+    def scores(self, query, rows=None, batch_size=4096):
+        """
+        Approximate similarity of query to every row (or to rows).
+
+        Rows are converted to float32 batch_size at a time into one reused
+        buffer, small enough to stay in cache; numpy has no fast float16 or
+        int8 matrix product, so this is the cheapest way to score them.
+        """
+        if rows is not None:
+            return self.rows(rows) @ query
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        buffer = np.empty((min(batch_size, len(self.codes)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), batch_size):
+            block = buffer[:len(self.codes[start:start + batch_size])]
+            block[...] = self.codes[start:start + len(block)]
+            np.matmul(block, query, out=scores[start:start + len(block)])
+        return scores * self.scales if self.scales is not None else scores
@@ -1,79 +1,54 @@
 # Import modules and packages
-import numpy as np
-import pickle
+import argparse
 
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_qdrant import Qdrant
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.document_loaders import WikipediaLoader
 #from langchain.schema import Document
 from transformers import BitsAndBytesConfig
 
+from embedding_cache import CachedEmbeddings, DEFAULT_EMBEDDING_CACHE_PATH
+from ingest import build, build_sources
+from quantization import EMBEDDING_DTYPES
 from RAG_inputs import wikipedia_queries, webpage_urls
+from vector_index import DEFAULT_INDEX_DIR
 
 # Set configuration for quantization
 quantization_config = BitsAndBytesConfig(load_in_8bit=True)
 
-def load_chunk_wiki(query, global_doc_number, chunk_size=512, overlap=50):
-
-  wiki_docs = WikipediaLoader(query=query, load_max_docs=4).load()
-
-  for idx, text in enumerate(wiki_docs):
-    wiki_docs[idx].metadata['doc_num'] = global_doc_number
-    wiki_docs[idx].metadata['doc_source'] = "Wikipedia"
-
-  global_doc_number += 1
-
-  text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
-  wiki_splits = text_splitter.split_documents(wiki_docs)
-  for idx, text in enumerate(wiki_splits):
-    wiki_splits[idx].metadata['split_id'] = idx
-
-  return wiki_splits, global_doc_number
-
-def load_chunk_web(query, global_doc_number, chunk_size=512, overlap=50):
-
-  web_docs = WebBaseLoader(query).load()
-
-  for idx, text in enumerate(web_docs):
-    web_docs[idx].metadata['doc_num'] = global_doc_number
-    web_docs[idx].metadata['doc_source'] = "Webpage"
-
-  global_doc_number += 1
-
-  text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
-  web_splits = text_splitter.split_documents(web_docs)
-  for idx, text in enumerate(web_splits):
-    web_splits[idx].metadata['split_id'] = idx
-
-  return web_splits, global_doc_number
-
-base_embeddings = HuggingFaceEmbeddings(model_name="avsolatorio/GIST-Embedding-v0")
-
-# Initialize vectorstore
-wiki_splits_0, global_doc_number_0 = load_chunk_wiki(wikipedia_queries[0], global_doc_number=0)
- 
-qdrant_vectorstore = Qdrant.from_documents(wiki_splits_0,
-                                            base_embeddings,
-                                            location=":memory:",
-                                            collection_name="history_db",
-                                            force_recreate=True)
- 
-global_doc_number = global_doc_number_0
- 
- # Vectorize the Wikipedia chunks
-for wiki_query in wikipedia_queries[1:]:
-  wiki_splits, global_doc_number = load_chunk_wiki(wiki_query, global_doc_number=global_doc_number)
-  qdrant_vectorstore.add_documents(documents=wiki_splits)
- 
-# Vectorize the Webpage chunks
-web_splits, global_doc_number = load_chunk_web(webpage_urls, global_doc_number=global_doc_number)
-qdrant_vectorstore.add_documents(documents=web_splits)
-
-# Create the retriever
-retriever = qdrant_vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 8})
-
-pick_insert = open('retriever.pkl','wb')
-pickle.dump(retriever, pick_insert)
-pick_insert.close()
\ No newline at end of file
+embedding_model_name = "avsolatorio/GIST-Embedding-v0"
+
+def build_index(index_dir=DEFAULT_INDEX_DIR, refresh=False, max_workers=8, batch_size=256, cache_path=DEFAULT_EMBEDDING_CACHE_PATH, cache_mb=2048, ann_lists=None, embedding_dtype="float32"):
+
+  # Only text the cache has not seen before reaches the embedding model
+  base_embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=embedding_model_name),
+                                     embedding_model_name,
+                                     path=cache_path,
+                                     max_bytes=cache_mb * 1024**2)
+
+  # Fetch, chunk and vectorize only the Wikipedia and Webpage sources missing from the index
+  sources = build_sources(wikipedia_queries, webpage_urls)
+  stats = build(index_dir, sources, base_embeddings, embedding_model_name, refresh=refresh, max_workers=max_workers, batch_size=batch_size, ann_lists=ann_lists,
+                embedding_dtype=embedding_dtype)
+
+  print(f"{stats['sources']} sources: {stats['added']} added, {stats['changed']} changed, "
+        f"{stats['reused']} reused, {stats['removed']} removed")
+  print(f"Wrote {stats['chunks']} chunks to {index_dir}, embedded {stats['chunks_embedded']} "
+        f"in {stats['seconds']:.1f}s ({stats['chunks_per_s']:.1f} chunks/s)")
+
+  cache_stats = base_embeddings.stats()
+  print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['cache_bytes'] / 1024**2:.1f} MB on disk")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Build or update the EduCreate history retrieval index.")
+  parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+  parser.add_argument("--refresh", action="store_true", help="Re-fetch known sources and re-embed any whose content changed")
+  parser.add_argument("--max-workers", type=int, default=8, help="Concurrent source fetches")
+  parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch")
+  parser.add_argument("--embedding-cache", default=DEFAULT_EMBEDDING_CACHE_PATH)
+  parser.add_argument("--embedding-cache-mb", type=int, default=2048, help="Size limit of the embedding cache")
+  parser.add_argument("--ann-lists", type=int, default=None, help="Build this many IVF lists for approximate search of large indexes (off by default; about 2*sqrt(chunks) is a good start)")
+  parser.add_argument("--embedding-dtype", choices=EMBEDDING_DTYPES, default="float32", help="Also store a float16 or int8 copy of the vectors for search to scan")
+  args = parser.parse_args()
+  build_index(args.index_dir, refresh=args.refresh, max_workers=args.max_workers, batch_size=args.batch_size,
+              cache_path=args.embedding_cache, cache_mb=args.embedding_cache_mb, ann_lists=args.ann_lists,
+              embedding_dtype=args.embedding_dtype)
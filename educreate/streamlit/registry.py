@@ -0,0 +1,83 @@
+import importlib
+import sys
+import threading
+import time
+
+class LazyRegistry:
+    """
+    Process-wide registry of heavy modules, models and clients, created on first use.
+
+    Modules are imported through module() and resources built through get(),
+    each at most once per process even when several sessions ask at the same
+    time. How long every import and load took is kept in timings, so a slow
+    start can be traced to the model or SDK responsible. warm_up() loads
+    registered resources on a background thread ahead of the first request.
+    """
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    def _name_lock(self, name):
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def module(self, name):
+        key = "import:" + name
+        if key in self.timings:
+            return sys.modules[name]
+        with self._name_lock(key):
+            # import_module waits for an import already running on another thread
+            start = time.perf_counter()
+            module = importlib.import_module(name)
+            self.timings.setdefault(key, time.perf_counter() - start)
+        return module
+
+    def register(self, name, loader):
+        with self._lock:
+            if name not in self._loaders:
+                self._loaders[name] = loader
+
+    def loaded(self, name):
+        return name in self._values
+
+    def get(self, name):
+        if name in self._values:
+            return self._values[name]
+        with self._name_lock("load:" + name):
+            if name not in self._values:
+                start = time.perf_counter()
+                self._values[name] = self._loaders[name]()
+                self.timings["load:" + name] = time.perf_counter() - start
+        return self._values[name]
+
+    def warm_up(self, names=None, modules=(), background=True):
+        names = list(self._loaders) if names is None else names
+
+        def load_all():
+            for name in modules:
+                try:
+                    self.module(name)
+                except Exception as error:
+                    print(f"Warm-up import of {name} failed: {error!r}")
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as error:
+                    print(f"Warm-up of {name} failed: {error!r}")
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="registry-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        """[(kind, name, seconds)] sorted slowest first."""
+        rows = [tuple(key.split(":", 1)) + (seconds,) for key, seconds in self.timings.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+registry = LazyRegistry()
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import threading
+import time
+
+from collections import OrderedDict
+
+from disk_cache import DiskCache
+
+DEFAULT_RESPONSE_CACHE_PATH = "./cache/responses.sqlite"
+
+def normalize_text(text):
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="ignore")
+    return " ".join(str(text).split()).casefold()
+
+def hash_text(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+# Key on the normalized inputs so resubmissions that differ only in case or
+# whitespace share an entry
+def response_key(kind, *parts):
+    return hash_text(json.dumps([kind] + [normalize_text(part) for part in parts]))
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses.
+
+    A small in-process LRU answers repeat requests without touching disk; misses
+    fall through to a DiskCache shared by all workers. Entries in both tiers
+    expire after ttl seconds. Values must be JSON serialisable and are returned
+    as fresh copies, so callers may mutate them.
+    """
+    def __init__(self, path=DEFAULT_RESPONSE_CACHE_PATH, max_entries=256, ttl=24 * 3600, max_bytes=256 * 1024**2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = DiskCache(path, max_bytes)
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                created, payload = entry
+                if now - created <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(payload)
+                del self.memory[key]
+
+        entry = self.disk.get(key, max_age=self.ttl, with_created=True)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        payload, created = entry
+        payload = payload.decode("utf-8")
+        with self._lock:
+            self.disk_hits += 1
+            # Keep the disk entry's age, so promotion to memory does not extend its ttl
+            self._remember(key, payload, created)
+        return json.loads(payload)
+
+    def set(self, key, value):
+        payload = json.dumps(value)
+        with self._lock:
+            self._remember(key, payload, time.time())
+        self.disk.set(key, payload.encode("utf-8"))
+
+    def get_or_create(self, key, create):
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value)
+            value = json.loads(json.dumps(value))
+        return value
+
+    def stats(self):
+        return {"memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self.memory)}
+
+    def _remember(self, key, payload, created):
+        self.memory[key] = (created, payload)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
@@ -0,0 +1,21 @@
+import functools
+
+from registry import registry
+
+# gpt-4o-mini's tokenizer (o200k_base); close enough to estimate Claude prompt sizes too
+DEFAULT_TOKENIZER_MODEL = "gpt-4o-mini"
+
+# Load the appropriate tokenizer for the model once per process
+@functools.lru_cache(maxsize=None)
+def get_encoding(model=DEFAULT_TOKENIZER_MODEL):
+    return registry.module("tiktoken").encoding_for_model(model)
+
+def count_tokens(text, model=DEFAULT_TOKENIZER_MODEL):
+    # Special tokens in user text ("<|endoftext|>") are counted as plain text instead of raising
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+def split_by_tokens(text, max_tokens, model=DEFAULT_TOKENIZER_MODEL):
+    """text cut into consecutive pieces of at most max_tokens tokens."""
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
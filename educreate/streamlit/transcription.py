@@ -0,0 +1,51 @@
+import random
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+def transcribe_segment(segment, transcribe, retries=3, backoff=1.0):
+    """Transcribe one Segment, retrying failures with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            segment.audio.seek(0)
+            return segment.index, transcribe(segment.audio)
+        except Exception as error:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt + random.uniform(0, backoff)
+            print(f"segment {segment.index} failed ({error!r}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def transcribe_segments(segments, transcribe, max_workers=4, retries=3, backoff=1.0, on_progress=None):
+    """
+    Transcribe a stream of Segments concurrently and return their texts in order.
+
+    transcribe takes an audio file object and returns its text. At most
+    max_workers requests are in flight, and segments are pulled from the
+    stream only as fast as they can be sent, so memory stays bounded.
+    on_progress(done, submitted) is called from the calling thread, which makes
+    it safe to update Streamlit elements from it.
+    """
+    texts = {}
+    pending = set()
+    submitted = 0
+
+    def collect(limit):
+        nonlocal pending
+        while len(pending) > limit:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, text = future.result()
+                texts[index] = text
+            if on_progress is not None:
+                on_progress(len(texts), submitted)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for segment in segments:
+            pending.add(executor.submit(transcribe_segment, segment, transcribe, retries, backoff))
+            submitted += 1
+            # Keep one segment queued behind the busy workers
+            collect(max_workers)
+        collect(0)
+
+    return [texts[index] for index in sorted(texts)]
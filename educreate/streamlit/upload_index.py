@@ -0,0 +1,34 @@
+import numpy as np
+
+from registry import registry
+from tokenizer import count_tokens
+from vector_index import normalize_rows
+
+class UploadIndex:
+    """
+    In-memory index over one uploaded document, kept in a session's state.
+
+    The text is chunked like the history sources and embedded with the
+    history index's model, so only the passages closest to the question
+    reach the prompt instead of the whole document. Nothing is written to
+    disk and the index goes away with the session.
+    """
+    def __init__(self, text, embeddings, chunk_size=512, overlap=50):
+        RecursiveCharacterTextSplitter = registry.module("langchain_text_splitters").RecursiveCharacterTextSplitter
+        self.embeddings = embeddings
+        self.texts = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap).split_text(text)
+        self.vectors = normalize_rows(embeddings.embed_documents(self.texts)) if self.texts else np.zeros((0, 0), dtype=np.float32)
+        self.total_tokens = count_tokens(text)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(self, query, k=4):
+        """The k passages most similar to query, in document order."""
+        if not self.texts:
+            return []
+        query_vector = normalize_rows([self.embeddings.embed_query(query)])[0]
+        scores = self.vectors @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.texts[row] for row in np.sort(top)]
@@ -0,0 +1,79 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+
+import streamlit as st
+
+from concurrent.futures import ProcessPoolExecutor
+
+from registry import registry
+
+# PDFs shorter than this are read in the calling process; handing pages to the pool costs more than it saves
+MIN_PAGES_PER_WORKER = 8
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+
+def pdf_pages_text(data, start, stop):
+    """Text of pages [start, stop) of a PDF; runs in a pool worker, which opens its own copy of the document."""
+    pymupdf = registry.module("pymupdf")
+    with pymupdf.open(stream=data, filetype="pdf") as doc:
+        return [doc[number].get_text() for number in range(start, stop)]
+
+def load_pdf_pool():
+    # Spawned rather than forked: the server process runs threads (and possibly CUDA) that must not be copied
+    return ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def load_ocr_reader():
+    return registry.module("easyocr").Reader(["en"])
+
+registry.register("pdf_pool", load_pdf_pool)
+registry.register("ocr_reader", load_ocr_reader)
+# One reader is shared by every session; readtext is not documented as thread-safe
+ocr_lock = threading.Lock()
+
+def extract_pdf_text(data, min_pages_per_worker=MIN_PAGES_PER_WORKER):
+    """
+    Text of every page of a PDF, in page order.
+
+    Long documents are split into contiguous page ranges, one per pool
+    worker, so each worker parses the file once and only page text is sent
+    back.
+    """
+    pymupdf = registry.module("pymupdf")
+    with pymupdf.open(stream=data, filetype="pdf") as doc:
+        page_count = doc.page_count
+        if page_count < 2 * min_pages_per_worker:
+            return "".join(page.get_text() for page in doc)
+
+    pool = registry.get("pdf_pool")
+    workers = min(PDF_WORKERS, page_count // min_pages_per_worker)
+    bounds = [page_count * i // workers for i in range(workers + 1)]
+    futures = [pool.submit(pdf_pages_text, data, start, stop) for start, stop in zip(bounds, bounds[1:])]
+    return "".join(text for future in futures for text in future.result())
+
+def extract_image_text(data):
+    reader = registry.get("ocr_reader")
+    with ocr_lock:
+        results = reader.readtext(data)
+    return " ".join(result[1] for result in results)
+
+def extract_text(file_name, data):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".pdf":
+        return extract_pdf_text(data)
+    if extension in (".jpg", ".jpeg", ".png"):
+        return extract_image_text(data)
+    return data.decode("utf-8", errors="replace")
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+@st.cache_data(max_entries=32, show_spinner="Reading the uploaded file")
+def cached_extract_text(file_name, digest, _data):
+    # Keyed by the content hash (and name, for the file type), so reruns and re-uploads of the same file are free
+    return extract_text(file_name, _data)
+
+def read_upload(uploaded_file):
+    """Text of a Streamlit UploadedFile, extracted once per distinct file content."""
+    data = uploaded_file.getvalue()
+    return cached_extract_text(uploaded_file.name, content_hash(data), data)
@@ -0,0 +1,336 @@
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+
+from ann_index import ANN_MIN_ROWS, DEFAULT_N_PROBE, IVFIndex
+from lexical_index import LexicalIndex, fuse
+from quantization import EMBEDDING_DTYPES, QuantizedMatrix, read_rows, save_quantized
+
+# On-disk layout of a built index (bump the version when any of these change):
+#   meta.json        format version, embedding model, vector count and dimension
+#   chunks.jsonl     one {"text": ..., "metadata": {...}} record per row, opened memory-mapped
+#   chunk_offsets.npy byte offset of every row's line in chunks.jsonl, plus the file size
+#   embeddings.npy   float32 matrix of L2-normalised vectors, opened memory-mapped
+#   manifest.json    optional; sources, document hashes and chunk rows for incremental builds
+#   ivf_*.npy        optional; IVF lists for approximate search (see ann_index), built for large indexes
+#   lexical_*        optional; BM25 inverted index over the chunk texts (see lexical_index)
+#   embeddings_*.npy optional; float16 or int8 copy that search scans instead (see quantization), named in meta.json
+#   READY            written last; an index without it is incomplete
+# Each build is written to its own <index_dir>.v<timestamp> directory and index_dir is a symlink to the
+# current one, swapped atomically; the previous version is kept for readers that resolved the link before it.
+INDEX_FORMAT_VERSION = 1
+DEFAULT_INDEX_DIR = "./history_index"
+READY_FILE = "READY"
+
+def index_ready(index_dir=DEFAULT_INDEX_DIR):
+    ready_path = os.path.join(index_dir, READY_FILE)
+    if not os.path.exists(ready_path):
+        return False
+    with open(ready_path) as ready_file:
+        return ready_file.read().strip() == str(INDEX_FORMAT_VERSION)
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k(scores, k):
+    """Indices of the k highest scores, highest first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def mmr(query_vector, candidate_vectors, k=4, lambda_mult=0.5):
+    """
+    Maximal marginal relevance over L2-normalised vectors; returns indices into candidate_vectors.
+
+    Picks the same documents as LangChain's maximal_marginal_relevance, but
+    the candidate similarity matrix is computed once and each pick is a
+    single vectorised update of every candidate's redundancy, instead of
+    re-scoring all candidates against everything selected so far in Python.
+    """
+    count = min(k, len(candidate_vectors))
+    if count <= 0:
+        return []
+    relevance = candidate_vectors @ query_vector
+    similarity = candidate_vectors @ candidate_vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(candidate_vectors), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < count:
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+def write_index(index_dir, texts, metadatas, embeddings, model_name, manifest=None, ann_lists=None, embedding_dtype="float32", lexical=True):
+    """
+    Write a complete index to index_dir.
+
+    The index is assembled in a new versioned sibling directory, and the
+    index_dir symlink is only swapped to it (atomically, with os.replace)
+    once every file, including the READY marker, has been written, so
+    readers never observe a half-built index or a missing one.
+
+    IVF lists for approximate search are opt-in: pass ann_lists (their
+    number; about 2 * sqrt(rows) is a good start) to build them for an index
+    of ANN_MIN_ROWS rows or more. Their recall depends on how clustered the
+    embeddings are, so check it with bench_retrieval.py on the real index
+    before turning them on.
+
+    With embedding_dtype "float16" or "int8", a copy of the vectors in that
+    type is stored too; search scans it instead of the float32 matrix, which
+    is then only read for the rows being rescored.
+
+    Unless lexical=False, a BM25 inverted index over texts is stored too,
+    for hybrid_search.
+    """
+    if embedding_dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"embedding_dtype must be one of {EMBEDDING_DTYPES}, got {embedding_dtype!r}")
+    if len(texts) != len(metadatas) or len(texts) != len(embeddings):
+        raise ValueError(f"Got {len(texts)} texts, {len(metadatas)} metadatas and {len(embeddings)} embeddings")
+
+    embeddings = normalize_rows(embeddings)
+    index_dir = index_dir.rstrip("/")
+    build_dir = f"{index_dir}.v{time.time_ns()}"
+    os.makedirs(build_dir)
+
+    np.save(os.path.join(build_dir, "embeddings.npy"), embeddings)
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(os.path.join(build_dir, "chunks.jsonl"), "wb") as chunk_file:
+        for row, (text, metadata) in enumerate(zip(texts, metadatas)):
+            offsets[row + 1] = offsets[row] + chunk_file.write((json.dumps({"text": text, "metadata": metadata}) + "\n").encode("utf-8"))
+    np.save(os.path.join(build_dir, "chunk_offsets.npy"), offsets)
+
+    meta = {"format_version": INDEX_FORMAT_VERSION,
+            "model_name": model_name,
+            "count": int(embeddings.shape[0]),
+            "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+            "embedding_dtype": embedding_dtype if len(embeddings) else "float32"}
+    with open(os.path.join(build_dir, "meta.json"), "w") as meta_file:
+        json.dump(meta, meta_file, indent=2)
+
+    if manifest is not None:
+        with open(os.path.join(build_dir, "manifest.json"), "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+
+    if meta["embedding_dtype"] != "float32":
+        save_quantized(build_dir, embeddings, embedding_dtype)
+
+    if lexical:
+        LexicalIndex.build(texts).save(build_dir)
+
+    if ann_lists and len(embeddings) >= ANN_MIN_ROWS:
+        IVFIndex.build(embeddings, n_lists=ann_lists).save(build_dir)
+
+    with open(os.path.join(build_dir, READY_FILE), "w") as ready_file:
+        ready_file.write(str(INDEX_FORMAT_VERSION))
+
+    publish(index_dir, build_dir)
+
+def index_versions(index_dir):
+    """Version directories written for index_dir, oldest first."""
+    parent, name = os.path.split(os.path.abspath(index_dir))
+    pattern = re.compile(re.escape(name) + r"\.v\d+")
+    return sorted((os.path.join(parent, entry) for entry in os.listdir(parent) if pattern.fullmatch(entry)),
+                  key=lambda path: int(path.rsplit(".v", 1)[1]))
+
+def publish(index_dir, version_dir):
+    """Point the index_dir symlink at version_dir and delete every version but it and the one it replaces."""
+    previous = os.path.realpath(index_dir) if os.path.islink(index_dir) else None
+    if os.path.isdir(index_dir) and not os.path.islink(index_dir):
+        # Indexes written before versioning were a plain directory; move it aside once
+        previous = f"{index_dir}.v0"
+        os.rename(index_dir, previous)
+
+    link = f"{index_dir}.link"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version_dir), link)
+    os.replace(link, index_dir)
+
+    keep = {os.path.realpath(version_dir), previous}
+    for path in index_versions(index_dir):
+        if os.path.realpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def line_offsets(data, block_bytes=64 * 1024**2):
+    """Byte offset of every line in data (a uint8 array) plus its length, found block by block."""
+    ends = [np.flatnonzero(data[start:start + block_bytes] == ord("\n")) + start + 1 for start in range(0, len(data), block_bytes)]
+    return np.concatenate([np.zeros(1, dtype=np.int64)] + [end.astype(np.int64) for end in ends])
+
+class ChunkStore:
+    """
+    Row-addressable, read-only view of an index's chunks.jsonl.
+
+    The file is memory-mapped like the embeddings and chunk_offsets.npy says
+    where each row's line starts, so a record is only decoded when its row
+    is read, and every worker shares the page-cache copy of the texts
+    instead of holding its own lists of them.
+    """
+    def __init__(self, index_dir):
+        path = os.path.join(index_dir, "chunks.jsonl")
+        # np.memmap cannot map an empty file
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+        offsets_path = os.path.join(index_dir, "chunk_offsets.npy")
+        if os.path.exists(offsets_path):
+            self.offsets = np.load(offsets_path, mmap_mode="r")
+        else:
+            # Indexes written before the offsets were stored; finding the line ends costs one pass over the file
+            self.offsets = line_offsets(self.data)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def record(self, row):
+        if not -len(self) <= row < len(self):
+            raise IndexError(f"row {row} out of range for {len(self)} chunks")
+        row %= len(self)
+        return json.loads(self.data[self.offsets[row]:self.offsets[row + 1]].tobytes())
+
+class ChunkField:
+    """Sequence of one field ("text" or "metadata") of every chunk, decoded from the ChunkStore on access."""
+    def __init__(self, store, field):
+        self.store = store
+        self.field = field
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.store.record(i)[self.field] for i in range(*row.indices(len(self)))]
+        return self.store.record(int(row))[self.field]
+
+    def __iter__(self):
+        return (self.store.record(row)[self.field] for row in range(len(self)))
+
+class VectorIndex:
+    """
+    Read-only view of an index written by write_index.
+
+    The embedding matrix is memory-mapped rather than read into memory, so
+    opening is cheap and every Streamlit worker on the host shares the same
+    page-cache copy of the vectors. The chunk texts and metadata are read
+    the same way, through a ChunkStore: texts and metadatas are sequences
+    that decode a row when it is indexed. If the index has IVF lists, search()
+    only scores the rows in the lists closest to the query. If it has a
+    float16 or int8 copy, search() scans that and rescores a shortlist with
+    the float32 rows, so only the smaller copy has to stay resident. If it
+    has a lexical index, hybrid_search() fuses BM25 and dense rankings.
+    """
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        # Resolve the symlink once, so every file comes from the same version even if a build swaps it meanwhile
+        index_dir = os.path.realpath(index_dir)
+        if not index_ready(index_dir):
+            raise FileNotFoundError(f"No ready index (format version {INDEX_FORMAT_VERSION}) at {index_dir}. Build it with 'python rag_poc.py'.")
+
+        with open(os.path.join(index_dir, "meta.json")) as meta_file:
+            self.meta = json.load(meta_file)
+
+        self.index_dir = index_dir
+        self.model_name = self.meta["model_name"]
+        self.embeddings = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+        self.ivf = IVFIndex.load(index_dir) if IVFIndex.exists(index_dir) else None
+        self.lexical = LexicalIndex.load(index_dir) if LexicalIndex.exists(index_dir) else None
+        self.embedding_dtype = self.meta.get("embedding_dtype", "float32")
+        self.quantized = QuantizedMatrix.load(index_dir, self.embedding_dtype) if self.embedding_dtype != "float32" else None
+
+        self.manifest = None
+        manifest_path = os.path.join(index_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+
+        self.chunks = ChunkStore(index_dir)
+        self.texts = ChunkField(self.chunks, "text")
+        self.metadatas = ChunkField(self.chunks, "metadata")
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def document(self, row):
+        # LangChain is only needed once documents are handed to a chain
+        from langchain_core.documents import Document
+        record = self.chunks.record(row)
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+    def vectors(self, rows):
+        """
+        float32 vectors of rows, read from the file rather than the mapping.
+
+        Touching a few scattered rows through the mapping can make most of
+        the matrix resident (see quantization.read_rows), which would undo
+        the point of scanning a quantized copy.
+        """
+        return read_rows(self.embeddings, rows)
+
+    def select_mmr(self, candidates, query_vector, k, lambda_mult=0.5):
+        """The k of candidates chosen by maximal marginal relevance, in pick order."""
+        # Read candidate rows in file order to keep the reads sequential
+        candidates = np.sort(candidates)
+        return candidates[mmr(query_vector, self.vectors(candidates), k=k, lambda_mult=lambda_mult)]
+
+    def search(self, query_embedding, k, n_probe=DEFAULT_N_PROBE, rescore=4, rows=None):
+        """
+        Rows of the k vectors most similar to query_embedding, best first, and the normalised query.
+
+        With IVF lists, only the rows in the n_probe closest lists are
+        scored; n_probe=0 forces an exact scan of every row. Passing rows
+        (ascending) scores only those instead. With a quantized copy, the
+        best k * rescore rows by approximate score are rescored at full
+        precision; rescore=0 returns the approximate ranking as is.
+        """
+        query = normalize_rows([query_embedding])[0]
+        if len(self) == 0:
+            # An index built from sources that all failed has a (0, 0) matrix that no query can be multiplied with
+            return np.zeros(0, dtype=np.int64), query
+        # Candidate rows come back ascending, so the memory-mapped reads stay sequential
+        if rows is None and self.ivf is not None and n_probe:
+            rows = self.ivf.candidates(query, n_probe)
+
+        if self.quantized is not None:
+            approximate = self.quantized.scores(query, rows)
+            shortlist = top_k(approximate, k * rescore if rescore else k)
+            shortlist = rows[shortlist] if rows is not None else shortlist
+            if not rescore:
+                return shortlist, query
+            shortlist = np.sort(shortlist)
+            scores = read_rows(self.embeddings, shortlist) @ query
+            return shortlist[top_k(scores, k)], query
+
+        if rows is None:
+            return top_k(self.embeddings @ query, k), query
+        scores = np.asarray(self.embeddings[rows]) @ query
+        return rows[top_k(scores, k)], query
+
+    def hybrid_search(self, query_text, query_embedding, k, n_probe=DEFAULT_N_PROBE, lexical_k=100, narrow=False):
+        """
+        Rows of the k chunks ranked best by fusing BM25 and dense similarity, and the normalised query.
+
+        The lexical_k best BM25 matches for query_text are fused with the k
+        nearest vectors by reciprocal rank. With narrow=True, and as long
+        as BM25 matched at least k chunks, the dense ranking is computed
+        over those matches only instead of over the whole index. Without a
+        lexical index this is search().
+        """
+        lexical_rows = self.lexical.search(query_text, lexical_k)[0] if self.lexical is not None else np.zeros(0, dtype=np.int64)
+        if narrow and len(lexical_rows) >= k:
+            dense_rows, query = self.search(query_embedding, k, rows=np.sort(lexical_rows))
+        else:
+            dense_rows, query = self.search(query_embedding, k, n_probe=n_probe)
+        if not len(lexical_rows):
+            return dense_rows, query
+        return fuse([dense_rows, lexical_rows])[:k], query